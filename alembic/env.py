@@ -4,13 +4,17 @@ from sqlalchemy import engine_from_config
 from sqlalchemy import pool
 
 from alembic import context
-from database import Base, engine
+from database import URL_DATABASE, Base, engine
 from models import *
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
 
+# Migrate the database the app uses; alembic.ini's URL is only a local default
+if URL_DATABASE:
+    config.set_main_option("sqlalchemy.url", URL_DATABASE.replace("%", "%%"))
+
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
 if config.config_file_name is not None:
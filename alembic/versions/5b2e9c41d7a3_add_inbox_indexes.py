@@ -0,0 +1,39 @@
+"""add inbox indexes
+
+Revision ID: 5b2e9c41d7a3
+Revises: 447ca332197f
+Create Date: 2026-10-17 10:12:05.118402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b2e9c41d7a3'
+down_revision: Union[str, Sequence[str], None] = '447ca332197f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = (
+    ('ix_messages_session_id_timestamp', 'messages', ['session_id', 'timestamp']),
+    ('ix_sessions_type_started_at', 'sessions', ['type', 'started_at']),
+    ('ix_sessions_user_id', 'sessions', ['user_id']),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY keeps messages writable while the index builds, it can't run in a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _ in INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,41 @@
+"""keyset pagination indexes
+
+Revision ID: 9d4f0a6c2e18
+Revises: 5b2e9c41d7a3
+Create Date: 2026-10-17 11:03:41.552190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4f0a6c2e18'
+down_revision: Union[str, Sequence[str], None] = '5b2e9c41d7a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# The cursor is (timestamp, id) / (started_at, id), the id tie-breaker has to
+# be in the index for the row comparison to become an index range scan
+REPLACED = (
+    ('ix_messages_session_id_timestamp', 'ix_messages_session_id_timestamp_id', 'messages', ['session_id', 'timestamp'], ['session_id', 'timestamp', 'id']),
+    ('ix_sessions_user_id', 'ix_sessions_user_id_started_at_id', 'sessions', ['user_id'], ['user_id', 'started_at', 'id']),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        for old, new, table, _, columns in REPLACED:
+            op.create_index(new, table, columns, unique=False, postgresql_concurrently=True, if_not_exists=True)
+            op.drop_index(old, table_name=table, postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for old, new, table, columns, _ in REPLACED:
+            op.create_index(old, table, columns, unique=False, postgresql_concurrently=True, if_not_exists=True)
+            op.drop_index(new, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,47 @@
+"""add complaint inbox
+
+Revision ID: c71a3e5f08b2
+Revises: 9d4f0a6c2e18
+Create Date: 2026-10-17 12:26:09.734615
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c71a3e5f08b2'
+down_revision: Union[str, Sequence[str], None] = '9d4f0a6c2e18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Rows for existing complaint sessions come from `python inbox.py backfill`
+    op.create_table('complaint_inbox',
+    sa.Column('session_id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=True),
+    sa.Column('email', sa.String(), nullable=True),
+    sa.Column('name', sa.Text(), nullable=True),
+    sa.Column('first_message_id', sa.UUID(), nullable=True),
+    sa.Column('first_message', sa.Text(), nullable=True),
+    sa.Column('first_message_at', sa.DateTime(), nullable=True),
+    sa.Column('message_count', sa.Integer(), nullable=False),
+    sa.Column('status', sa.Enum('OPEN', 'ANSWERED', name='complaintstatus'), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('last_activity_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['session_id'], ['sessions.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('session_id')
+    )
+    op.create_index('ix_complaint_inbox_created_at', 'complaint_inbox', ['created_at', 'session_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_complaint_inbox_created_at', table_name='complaint_inbox')
+    op.drop_table('complaint_inbox')
+    sa.Enum(name='complaintstatus').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,53 @@
+"""add message search
+
+Revision ID: e4a8b6d1f953
+Revises: c71a3e5f08b2
+Create Date: 2026-10-17 14:08:52.306714
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a8b6d1f953'
+down_revision: Union[str, Sequence[str], None] = 'c71a3e5f08b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # A stored vector so ranking doesn't re-parse every matching message.
+    # Adding it rewrites `messages` under an exclusive lock (~40 s per 2M rows);
+    # the API keeps accepting messages meanwhile, they wait in the Redis stream.
+    # 'simple' lowercases without stemming, there is no Mongolian dictionary;
+    # lowercasing Cyrillic needs a UTF-8 LC_CTYPE, the postgres image's default.
+    op.add_column('messages', sa.Column(
+        'search_vector', postgresql.TSVECTOR(),
+        sa.Computed("to_tsvector('simple'::regconfig, coalesce(text, ''))", persisted=True),
+        nullable=True,
+    ))
+    with op.get_context().autocommit_block():
+        op.create_index('ix_messages_search_vector', 'messages', ['search_vector'], unique=False,
+                        postgresql_using='gin', postgresql_concurrently=True, if_not_exists=True)
+        # Misspelled words, see queries.search_messages(fuzzy=True)
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_text_trgm "
+            "ON messages USING gin (text gin_trgm_ops)"
+        )
+        # Date filters, combined with the GIN indexes in a BitmapAnd
+        op.create_index('ix_messages_timestamp', 'messages', ['timestamp'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name in ('ix_messages_timestamp', 'ix_messages_text_trgm', 'ix_messages_search_vector'):
+            op.drop_index(name, table_name='messages', postgresql_concurrently=True, if_exists=True)
+    op.drop_column('messages', 'search_vector')
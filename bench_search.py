@@ -0,0 +1,171 @@
+"""
+Benchmark message search (queries.search_messages) on a seeded dataset.
+
+Seeds synthetic Mongolian chat transcripts into a local Postgres that has
+the Alembic migrations applied, then times a set of searches, exact
+(full-text prefix match only) and fuzzy (plus trigram similarity), and
+reports latency percentiles, result counts and the indexes each plan used.
+Searches without a date filter cover the default SEARCH_DEFAULT_DAYS.
+
+The seeded vocabulary is small, so common words match a far larger share
+of messages than in real transcripts; treat those numbers as a worst case.
+
+    alembic upgrade head
+    python bench_search.py --messages 1000000          # seed (idempotent) and benchmark
+    python bench_search.py --modes exact --runs 50
+"""
+import sys
+import json
+import time
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import text
+
+from database import engine
+from models import SessionType
+from queries import search_messages
+
+
+SEED_MARKER = "search-bench"
+
+# Roughly ordered by frequency: seeded text draws early words far more often,
+# so the queries below cover common, mid and rare terms
+VOCABULARY = (
+    "сайн байна уу би таны захиалга захиалгын хүргэлт хүргэлтийн төлбөр төлбөрийн "
+    "асуулт хариу тусламж үйлчилгээ үйлчилгээний өнөөдөр маргааш өчигдөр бараа барааны "
+    "үнэ хямдрал карт данс мөнгө шилжүүлэг хаяг утас дугаар хугацаа хоцорсон удаан "
+    "буцаалт буцаах гомдол гомдлын ажилтан дэлгүүр эвдэрсэн буруу солих цуцлах баталгаа "
+    "баримт банк апп нэвтрэх нууц үг сэргээх мэдээлэл хэрэглэгч Улаанбаатар дүүрэг хороо "
+    "байр тоот хөргөгч угаалгын машин зурагт цахилгаан тоног төхөөрөмж баталгаат засвар"
+).split()
+
+QUERIES = (
+    ("common_word", "захиалга", {}),
+    ("inflected_prefix", "захиалгын", {}),
+    ("two_words", "хүргэлт хоцорсон", {}),
+    ("rare_words", "хөргөгч засвар", {}),
+    ("misspelled", "хөргөгчь", {}),
+    ("common_word_365_days", "захиалга", {"since": timedelta(days=365)}),
+    ("complaints_30_days", "төлбөр", {"session_type": SessionType.COMPLAIN, "since": timedelta(days=30)}),
+    ("one_user", "буцаалт", {"user": True}),
+)
+
+
+def seed(messages: int, per_session: int, complain_share: float, batch: int = 2000):
+    sessions = -(-messages // per_session)
+    with engine.begin() as conn:
+        existing = conn.execute(text("SELECT count(*) FROM sessions WHERE title = :marker"), {"marker": SEED_MARKER}).scalar()
+        if existing < sessions:
+            users = max(1, sessions // 50)
+            conn.execute(text("""
+                INSERT INTO users (id, email, name, started_at)
+                SELECT gen_random_uuid(), :marker || '-' || g || '@example.com', 'Bench user ' || g, now()
+                FROM generate_series(1, :users) g
+                ON CONFLICT (email) DO NOTHING
+            """), {"marker": SEED_MARKER, "users": users})
+            conn.execute(text("""
+                INSERT INTO sessions (id, user_id, type, title, started_at)
+                SELECT gen_random_uuid(),
+                       (SELECT id FROM users WHERE email = :marker || '-' || (1 + g % :users) || '@example.com'),
+                       (CASE WHEN random() < :share THEN 'COMPLAIN' ELSE 'CHAT' END)::sessiontype,
+                       :marker, now() - random() * interval '365 days'
+                FROM generate_series(1, :count) g
+            """), {"marker": SEED_MARKER, "users": users, "share": complain_share, "count": sessions - existing})
+
+    started = time.perf_counter()
+    total = 0
+    while True:
+        # Batches keep transactions (and GIN pending lists) small
+        with engine.begin() as conn:
+            inserted = conn.execute(text("""
+                WITH batch AS (
+                    SELECT s.id, s.started_at FROM sessions s
+                    WHERE s.title = :marker AND NOT EXISTS (SELECT 1 FROM messages m WHERE m.session_id = s.id)
+                    LIMIT :batch
+                )
+                INSERT INTO messages (id, session_id, text, is_from_user, timestamp)
+                SELECT gen_random_uuid(), b.id,
+                       (SELECT string_agg(word, ' ') FROM (
+                            SELECT vocab[1 + floor(power(random(), 2.5) * array_length(vocab, 1))::int] AS word
+                            FROM generate_series(1, 5 + (g % 11))
+                        ) words),
+                       g % 2 = 1, b.started_at + g * interval '1 minute'
+                FROM batch b
+                CROSS JOIN generate_series(1, :per_session) g
+                CROSS JOIN (SELECT CAST(:vocab AS text[]) AS vocab) v
+            """), {"marker": SEED_MARKER, "batch": batch, "per_session": per_session, "vocab": list(VOCABULARY)}).rowcount
+        if not inserted:
+            break
+        total += inserted
+        print(f"Seeded {total} messages ({total / (time.perf_counter() - started):.0f}/s)", file=sys.stderr)
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM ANALYZE messages"))
+        return conn.execute(text("SELECT count(*) FROM messages")).scalar()
+
+
+def plan_indexes(node) -> set:
+    found = {node["Index Name"]} if "Index Name" in node else set()
+    for child in node.get("Plans", ()):
+        found |= plan_indexes(child)
+    return found
+
+
+def bench_query(conn, statement, runs: int) -> dict:
+    sql = str(statement.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    plan = conn.exec_driver_sql(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}").scalar()
+    plan = (plan if isinstance(plan, list) else json.loads(plan))[0]
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        rows = conn.execute(statement).all()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "p50_ms": round(float(np.percentile(timings, 50)), 2),
+        "p95_ms": round(float(np.percentile(timings, 95)), 2),
+        "max_ms": round(max(timings), 2),
+        "rows": len(rows),
+        "indexes": sorted(plan_indexes(plan["Plan"])),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1_000_000, help="make sure this many messages exist (0 skips seeding)")
+    parser.add_argument("--per-session", type=int, default=20)
+    parser.add_argument("--complain-share", type=float, default=0.3)
+    parser.add_argument("--modes", default="exact,fuzzy", help="comma separated: exact, fuzzy")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    if engine.dialect.name != "postgresql":
+        sys.exit("bench_search.py needs a Postgres URL_DATABASE")
+
+    count = seed(args.messages, args.per_session, args.complain_share) if args.messages else None
+    with engine.connect() as conn:
+        user_id = conn.execute(text(
+            "SELECT user_id FROM sessions WHERE title = :marker LIMIT 1"
+        ), {"marker": SEED_MARKER}).scalar()
+        indexes = conn.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE indexname IN ('ix_messages_search_vector', 'ix_messages_text_trgm', 'ix_messages_timestamp')"
+        )).scalars().all()
+
+        report = {"messages": count, "search_indexes": sorted(indexes), "results": {}}
+        for mode in args.modes.split(","):
+            for name, q, filters in QUERIES:
+                kwargs = {"limit": args.limit, "fuzzy": mode == "fuzzy"}
+                if "session_type" in filters:
+                    kwargs["session_type"] = filters["session_type"]
+                if "since" in filters:
+                    kwargs["since"] = datetime.now() - filters["since"]
+                if filters.get("user"):
+                    kwargs["user_id"] = user_id
+                print(f"{mode} {name}...", file=sys.stderr)
+                report["results"][f"{mode}/{name}"] = bench_query(conn, search_messages(q, **kwargs), args.runs)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
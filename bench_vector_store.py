@@ -0,0 +1,183 @@
+"""
+Benchmark the NumPy memory-mapped vector store against Chroma.
+
+Each store runs in its own subprocess and reports build time, open (startup)
+time, RSS, query latency and recall@k against exact float32 search.
+
+    python bench_vector_store.py                    # main.txt chunks, real model
+    python bench_vector_store.py --synthetic 20000  # random vectors, no model needed
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+
+STORES = ("chroma", "numpy-float16", "numpy-int8")
+
+
+class PrecomputedEmbeddings(Embeddings):
+    """Serves vectors computed once by the parent, so both stores index identical data"""
+
+    def __init__(self, texts, vectors):
+        self.lookup = dict(zip(texts, vectors.tolist()))
+
+    def embed_documents(self, texts):
+        return [self.lookup[text] for text in texts]
+
+    def embed_query(self, text):
+        return self.lookup[text]
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def prepare(work_dir: str, synthetic: int, n_queries: int):
+    if synthetic:
+        rng = np.random.default_rng(0)
+        texts = [f"chunk {i}" for i in range(synthetic)]
+        docs = rng.normal(size=(synthetic, 1024)).astype(np.float32)
+        # Queries are perturbed documents so there is a meaningful nearest neighbour
+        picks = rng.choice(synthetic, size=n_queries, replace=False)
+        queries = docs[picks] + rng.normal(scale=0.5, size=(n_queries, 1024)).astype(np.float32)
+    else:
+        from ingest import FILES_DIR, scan_sources, split_source, make_text_splitter
+        from embeddings import load_embedding_model
+
+        splitter = make_text_splitter()
+        texts = [doc.page_content for source in scan_sources(FILES_DIR) for doc in split_source(FILES_DIR, source, splitter)]
+        model = load_embedding_model(os.getenv("EMBEDDING_BACKEND", "torch"), os.getenv("ONNX_MODEL_DIR"))
+        docs = np.asarray(model.embed_documents(texts), dtype=np.float32)
+        query_texts = [text.strip().split("\n")[0][:120] for text in texts[:n_queries]]
+        queries = np.asarray(model.embed_documents(query_texts), dtype=np.float32)
+
+    docs /= np.linalg.norm(docs, axis=1, keepdims=True)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    np.save(os.path.join(work_dir, "docs.npy"), docs)
+    np.save(os.path.join(work_dir, "queries.npy"), queries)
+    with open(os.path.join(work_dir, "texts.json"), "w", encoding="utf-8") as f:
+        json.dump(texts, f, ensure_ascii=False)
+
+
+def open_store(kind: str, directory: str, embeddings):
+    if kind == "chroma":
+        import chromadb
+        from langchain_chroma import Chroma
+        return Chroma(
+            persist_directory=directory,
+            embedding_function=embeddings,
+            client_settings=chromadb.config.Settings(anonymized_telemetry=False, is_persistent=True),
+        )
+    from vector_index import NumpyVectorStore
+    return NumpyVectorStore(directory, embeddings, dtype=kind.split("-", 1)[1])
+
+
+def run_store(kind: str, work_dir: str, k: int):
+    """Child process: build, reopen and query one store"""
+    docs = np.load(os.path.join(work_dir, "docs.npy"))
+    queries = np.load(os.path.join(work_dir, "queries.npy"))
+    with open(os.path.join(work_dir, "texts.json"), encoding="utf-8") as f:
+        texts = json.load(f)
+    embeddings = PrecomputedEmbeddings(texts, docs)
+    store_dir = tempfile.mkdtemp(prefix=f"bench-{kind}-")
+    ids = [str(i) for i in range(len(texts))]
+    documents = [Document(page_content=text, metadata={"chunk_id": chunk}) for text, chunk in zip(texts, ids)]
+
+    started = time.perf_counter()
+    store = open_store(kind, store_dir, embeddings)
+    # Ingestion-sized batches, the NumPy store appends each one and Chroma caps batch size itself
+    batch = 5000
+    for start in range(0, len(documents), batch):
+        store.add_documents(documents[start:start + batch], ids=ids[start:start + batch])
+    build_seconds = time.perf_counter() - started
+    del store
+
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    store = open_store(kind, store_dir, embeddings)
+    store.similarity_search_by_vector(queries[0].tolist(), k=k)  # first query loads lazy segments
+    open_seconds = time.perf_counter() - started
+
+    latencies = []
+    results = []
+    for query in queries:
+        started = time.perf_counter()
+        found = store.similarity_search_by_vector(query.tolist(), k=k)
+        latencies.append(time.perf_counter() - started)
+        results.append([int(doc.metadata["chunk_id"]) for doc in found])
+
+    latencies_ms = np.asarray(latencies) * 1000
+    stats = {
+        "store": kind,
+        "build_seconds": round(build_seconds, 3),
+        "open_seconds": round(open_seconds, 3),
+        "rss_open_mb": round(rss_mb() - rss_before, 1),
+        "query_latency_ms": {
+            "p50": round(float(np.percentile(latencies_ms, 50)), 3),
+            "p95": round(float(np.percentile(latencies_ms, 95)), 3),
+            "p99": round(float(np.percentile(latencies_ms, 99)), 3),
+        },
+        "results": results,
+    }
+    with open(os.path.join(work_dir, f"{kind}.json"), "w") as f:
+        json.dump(stats, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--synthetic", type=int, default=0, help="use N random 1024-d vectors instead of the corpus")
+    parser.add_argument("--out", default=None, help="write the JSON report here as well as stdout")
+    parser.add_argument("--store", help=argparse.SUPPRESS)
+    parser.add_argument("--work-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.store:
+        run_store(args.store, args.work_dir, args.k)
+        return
+
+    work_dir = tempfile.mkdtemp(prefix="bench-vectors-")
+    prepare(work_dir, args.synthetic, args.queries)
+    for kind in STORES:
+        print(f"Benchmarking {kind}...", file=sys.stderr)
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--store", kind, "--work-dir", work_dir, "--k", str(args.k)],
+            check=True,
+        )
+
+    docs = np.load(os.path.join(work_dir, "docs.npy"))
+    queries = np.load(os.path.join(work_dir, "queries.npy"))
+    truth = np.argsort(-(queries @ docs.T), axis=1)[:, :args.k]
+
+    report = {"k": args.k, "chunks": len(docs), "queries": len(queries), "stores": {}}
+    for kind in STORES:
+        with open(os.path.join(work_dir, f"{kind}.json")) as f:
+            stats = json.load(f)
+        results = stats.pop("results")
+        stats[f"recall@{args.k}"] = round(float(np.mean([
+            len(set(t.tolist()) & set(r)) / args.k for t, r in zip(truth, results)
+        ])), 4)
+        report["stores"][kind] = stats
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
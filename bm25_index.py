@@ -0,0 +1,183 @@
+import os
+import json
+import hashlib
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+META_FILE = "meta.json"
+ARRAY_FILES = ("idf", "doc_len", "indptr", "postings", "term_freqs")
+
+
+def default_preprocess(text: str) -> List[str]:
+    # Same tokenization BM25Retriever uses by default
+    return text.split()
+
+
+def fingerprint(texts: List[str]) -> str:
+    """Stable hash of the chunk set, used to decide when the index is stale"""
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a fixed chunk list, scored the same way as rank_bm25.BM25Okapi.
+
+    Postings are stored term-major (CSR style) as plain .npy arrays so the
+    index can be saved next to the vector store and memory-mapped on startup
+    instead of being re-tokenized for every query.
+    """
+
+    def __init__(self, vocab, idf, doc_len, indptr, postings, term_freqs, meta):
+        self.vocab = vocab
+        self.idf = idf
+        self.doc_len = doc_len
+        self.indptr = indptr
+        self.postings = postings
+        self.term_freqs = term_freqs
+        self.meta = meta
+        self.k1 = meta["k1"]
+        self.b = meta["b"]
+        self.avgdl = meta["avgdl"]
+        # Per-document length normalisation is query independent, do it once
+        self._norm = (self.k1 * (1 - self.b + self.b * np.asarray(doc_len, dtype=np.float32) / self.avgdl)).astype(np.float32)
+
+    @property
+    def fingerprint(self) -> str:
+        return self.meta["fingerprint"]
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    @classmethod
+    def build(cls, texts: List[str], k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25,
+              chunk_fingerprint: Optional[str] = None):
+        vocab = {}
+        doc_len = np.zeros(len(texts), dtype=np.int32)
+        rows = []  # (term, doc, tf)
+
+        for doc, text in enumerate(texts):
+            tokens = default_preprocess(text)
+            doc_len[doc] = len(tokens)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                term = vocab.setdefault(token, len(vocab))
+                rows.append((term, doc, tf))
+
+        rows.sort()
+        n_terms = len(vocab)
+        terms = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        postings = np.fromiter((r[1] for r in rows), dtype=np.int32, count=len(rows))
+        term_freqs = np.fromiter((r[2] for r in rows), dtype=np.float32, count=len(rows))
+        df = np.bincount(terms, minlength=n_terms)
+        indptr = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(df, out=indptr[1:])
+
+        # Same idf (with epsilon floor for very common terms) as BM25Okapi
+        n_docs = len(texts)
+        idf = (np.log(n_docs - df + 0.5) - np.log(df + 0.5)).astype(np.float32)
+        if n_terms:
+            average_idf = float(idf.sum()) / n_terms
+            idf[idf < 0] = epsilon * average_idf
+
+        meta = {
+            "k1": k1,
+            "b": b,
+            "avgdl": float(doc_len.sum()) / max(n_docs, 1) or 1.0,
+            "n_docs": n_docs,
+            "fingerprint": chunk_fingerprint or fingerprint(texts),
+        }
+        return cls(vocab, idf, doc_len, indptr, postings, term_freqs, meta)
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+
+        def replace(name, write):
+            # A live index may have the old file mapped, it keeps the old inode
+            tmp_path = os.path.join(directory, f"tmp.{name}")
+            write(tmp_path)
+            os.replace(tmp_path, os.path.join(directory, name))
+
+        def save_array(array):
+            def write(path):
+                with open(path, "wb") as f:
+                    np.save(f, array)
+            return write
+
+        def save_json(value, **kwargs):
+            def write(path):
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(value, f, **kwargs)
+            return write
+
+        for name in ARRAY_FILES:
+            replace(f"{name}.npy", save_array(getattr(self, name)))
+        replace("vocab.json", save_json(self.vocab, ensure_ascii=False))
+        # Meta is written last so a half-written index is never treated as valid
+        replace(META_FILE, save_json(self.meta))
+
+    @classmethod
+    def load(cls, directory: str):
+        with open(os.path.join(directory, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(os.path.join(directory, "vocab.json"), encoding="utf-8") as f:
+            vocab = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+            for name in ARRAY_FILES
+        }
+        return cls(vocab, meta=meta, **arrays)
+
+    @classmethod
+    def load_or_build(cls, directory: str, texts: Iterable[str], expected: Optional[str] = None):
+        """
+        Reuse the persisted index unless the chunk set changed since it was built.
+
+        With an `expected` fingerprint (e.g. the chunk store's) texts is only
+        iterated when the index actually has to be rebuilt.
+        """
+        if expected is None:
+            texts = list(texts)
+            expected = fingerprint(texts)
+        try:
+            index = cls.load(directory)
+            if index.fingerprint == expected:
+                print(f"Loaded BM25 index from {directory}")
+                return index
+            print("Chunk set changed, rebuilding BM25 index...")
+        except (FileNotFoundError, ValueError, KeyError) as e:
+            print(f"BM25 index not usable ({e}), building...")
+
+        index = cls.build(list(texts), chunk_fingerprint=expected)
+        index.save(directory)
+        return cls.load(directory)
+
+    def get_scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self.doc_len), dtype=np.float32)
+        for token in default_preprocess(query):
+            term = self.vocab.get(token)
+            if term is None:
+                continue
+            start, end = self.indptr[term], self.indptr[term + 1]
+            docs = self.postings[start:end]
+            tf = self.term_freqs[start:end]
+            scores[docs] += self.idf[term] * (tf * (self.k1 + 1) / (tf + self._norm[docs]))
+        return scores
+
+    def search(self, query: str, k: int, scores: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Top-k (chunk position, score) pairs, best first"""
+        if scores is None:
+            scores = self.get_scores(query)
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(i), float(scores[i])) for i in top]
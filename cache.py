@@ -0,0 +1,79 @@
+import re
+import time
+import threading
+import unicodedata
+from typing import Optional
+from collections import OrderedDict
+
+from metrics import Counter, Gauge
+
+
+CACHE_HITS = Counter("rag_cache_hits_total", "Cache lookups that found a live entry", labelnames=("cache",))
+CACHE_MISSES = Counter("rag_cache_misses_total", "Cache lookups that found nothing (or an expired entry)", labelnames=("cache",))
+CACHE_EVICTIONS = Counter("rag_cache_evictions_total", "Entries dropped for size or age", labelnames=("cache",))
+CACHE_ENTRIES = Gauge("rag_cache_entries", "Entries currently cached", labelnames=("cache",))
+
+
+def normalize_query(text: str) -> str:
+    """Cache key for a user query: NFC, case-folded, whitespace collapsed"""
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+def export_cache_metrics(name: str, cache):
+    """Report a cache's hits, misses, evictions and size on /metrics as cache=`name`, read at scrape time"""
+    CACHE_HITS.labels(name).set_function(lambda: cache.hits)
+    CACHE_MISSES.labels(name).set_function(lambda: cache.misses)
+    CACHE_EVICTIONS.labels(name).set_function(lambda: cache.evictions)
+    CACHE_ENTRIES.labels(name).set_function(lambda: len(cache))
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after `ttl` seconds.
+
+    Keeps hit/miss/eviction counters, exported on /metrics when given a `name`.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600, name: Optional[str] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if name is not None:
+            export_cache_metrics(name, self)
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expires_at = item
+            if expires_at < now:
+                del self._data[key]
+                self.evictions += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
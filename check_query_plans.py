@@ -0,0 +1,194 @@
+"""
+Query-plan regression check for the list endpoints (complaint inbox, the
+keyset-paginated session and message listings, message search), run
+against a Postgres that has the Alembic migrations applied.
+
+Each check EXPLAIN ANALYZEs the statement a route runs and fails if the
+plan sequentially scans a table the indexes are meant to cover, or if it
+runs slower than --max-ms. Exits non-zero on any failure.
+
+Nothing runs it automatically. Before merging changes to models, migrations
+or queries.py, run it against the throwaway database docker-compose.yml
+starts for it (the "checks" profile), which migrates, seeds and checks:
+
+    docker compose --profile checks run --rm plan-check
+
+or against any local Postgres that can be seeded:
+
+    python check_query_plans.py --migrate --seed 20000   # apply migrations, seed (idempotent)
+    python check_query_plans.py --verbose                # print every plan
+"""
+import os
+import sys
+import json
+import argparse
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from database import engine
+from inbox import backfill
+from queries import complaint_inbox, encode_cursor, search_messages, session_messages, user_sessions
+
+
+SEED_MARKER = "plan-check"
+
+# name -> (statement factory taking the connection, tables that must be reached through an index)
+CHECKS = {
+    "complaint_inbox": (lambda conn: complaint_inbox(limit=50), ("complaint_inbox",)),
+    "complaint_inbox_window": (
+        lambda conn: complaint_inbox(since=datetime.now() - timedelta(days=90), until=datetime.now() - timedelta(days=60), limit=50),
+        ("complaint_inbox",),
+    ),
+    "session_list_page": (
+        lambda conn: user_sessions(sample_session(conn).user_id, after=page_cursor(conn, "sessions"), limit=51),
+        ("sessions",),
+    ),
+    "message_list_page": (
+        lambda conn: session_messages(sample_session(conn).id, after=page_cursor(conn, "messages"), limit=51),
+        ("messages",),
+    ),
+    "message_search_user": (
+        lambda conn: search_messages("seeded message", user_id=sample_session(conn).user_id, limit=51, fuzzy=False),
+        ("messages",),
+    ),
+}
+
+
+def sample_session(conn):
+    """Newest seeded session, the pagination checks list it and its user's sessions"""
+    row = conn.execute(text("""
+        SELECT s.id, s.user_id FROM sessions s
+        WHERE s.title = :marker ORDER BY s.started_at DESC LIMIT 1
+    """), {"marker": SEED_MARKER}).first()
+    if row is None:
+        sys.exit("No seeded data, run with --seed first")
+    return row
+
+
+def page_cursor(conn, table: str) -> str:
+    """Cursor a few rows into the sample session's (or its user's) listing"""
+    session = sample_session(conn)
+    if table == "sessions":
+        row = conn.execute(text("""
+            SELECT started_at, id FROM sessions WHERE user_id = :user_id
+            ORDER BY started_at DESC, id DESC OFFSET 5 LIMIT 1
+        """), {"user_id": session.user_id}).first()
+    else:
+        row = conn.execute(text("""
+            SELECT timestamp, id FROM messages WHERE session_id = :session_id
+            ORDER BY timestamp, id OFFSET 5 LIMIT 1
+        """), {"session_id": session.id}).first()
+    return encode_cursor(row[0], row[1]) if row else None
+
+
+def seed(conn, sessions: int, messages_per_session: int, complain_share: float):
+    """Synthetic users, sessions spread over a year and their messages, generated server side"""
+    existing = conn.execute(text("SELECT count(*) FROM sessions WHERE title = :marker"), {"marker": SEED_MARKER}).scalar()
+    if existing >= sessions:
+        print(f"{existing} seeded sessions already present")
+        return
+    users = max(1, sessions // 20)
+    conn.execute(text("""
+        INSERT INTO users (id, email, name, started_at)
+        SELECT gen_random_uuid(), :marker || '-' || g || '@example.com', 'Seeded user ' || g, now()
+        FROM generate_series(1, :users) g
+        ON CONFLICT (email) DO NOTHING
+    """), {"marker": SEED_MARKER, "users": users})
+    conn.execute(text("""
+        INSERT INTO sessions (id, user_id, type, title, started_at)
+        SELECT gen_random_uuid(), u.id,
+               (CASE WHEN random() < :share THEN 'COMPLAIN' ELSE 'CHAT' END)::sessiontype,
+               :marker, now() - random() * interval '365 days'
+        FROM (SELECT id FROM users WHERE email LIKE :marker || '-%') u
+        CROSS JOIN generate_series(1, :per_user)
+    """), {"marker": SEED_MARKER, "share": complain_share, "per_user": -(-(sessions - existing) // users)})
+    conn.execute(text("""
+        INSERT INTO messages (id, session_id, text, is_from_user, timestamp)
+        SELECT gen_random_uuid(), s.id, 'Seeded message ' || g, g % 2 = 1, s.started_at + g * interval '1 minute'
+        FROM sessions s
+        CROSS JOIN generate_series(1, :per_session) g
+        WHERE s.title = :marker AND NOT EXISTS (SELECT 1 FROM messages m WHERE m.session_id = s.id)
+    """), {"marker": SEED_MARKER, "per_session": messages_per_session})
+    conn.execute(text("ANALYZE users, sessions, messages"))
+    print(f"Seeded up to {sessions} sessions with {messages_per_session} messages each")
+
+
+def migrate():
+    """Apply the Alembic migrations to URL_DATABASE (alembic/env.py reads it)"""
+    from alembic import command
+    from alembic.config import Config
+
+    command.upgrade(Config(os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")), "head")
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get("Plans", ()):
+        yield from plan_nodes(child)
+
+
+def explain(conn, statement) -> dict:
+    sql = str(statement.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    row = conn.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}").scalar()
+    plan = row if isinstance(row, list) else json.loads(row)
+    return plan[0]
+
+
+def run_check(conn, name: str, factory, indexed_tables, max_ms: float, verbose: bool) -> bool:
+    result = explain(conn, factory(conn))
+    nodes = list(plan_nodes(result["Plan"]))
+    seq_scans = sorted({
+        node["Relation Name"] for node in nodes
+        if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in indexed_tables
+    })
+    elapsed = result["Execution Time"]
+    ok = not seq_scans and elapsed <= max_ms
+    print(
+        f"{'ok  ' if ok else 'FAIL'} {name}: {elapsed:.2f} ms, "
+        f"{result['Plan'].get('Actual Rows', 0)} rows"
+        + (f", sequential scan on {', '.join(seq_scans)}" if seq_scans else "")
+    )
+    if verbose or not ok:
+        print(json.dumps(result["Plan"], indent=2))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--migrate", action="store_true", help="run alembic upgrade head on URL_DATABASE first")
+    parser.add_argument("--seed", type=int, default=0, help="make sure this many synthetic sessions exist first")
+    parser.add_argument("--messages-per-session", type=int, default=20)
+    parser.add_argument("--complain-share", type=float, default=0.3)
+    parser.add_argument("--max-ms", type=float, default=50.0, help="fail checks slower than this")
+    parser.add_argument("--only", choices=sorted(CHECKS), action="append", help="run just these checks")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if engine.dialect.name != "postgresql":
+        sys.exit("check_query_plans.py needs a Postgres URL_DATABASE")
+
+    if args.migrate:
+        migrate()
+    if args.seed:
+        with engine.begin() as conn:
+            seed(conn, args.seed, args.messages_per_session, args.complain_share)
+        with Session(engine) as db:
+            backfill(db)
+            db.execute(text("ANALYZE complaint_inbox"))
+            db.commit()
+
+    failed = []
+    with engine.connect() as conn:
+        for name in args.only or CHECKS:
+            factory, indexed_tables = CHECKS[name]
+            if not run_check(conn, name, factory, indexed_tables, args.max_ms, args.verbose):
+                failed.append(name)
+            conn.rollback()
+    if failed:
+        sys.exit(f"{len(failed)} query plan check(s) failed: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import os
+import json
+import mmap
+import hashlib
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+
+META_FILE = "meta.json"
+
+
+class ChunkStore:
+    """
+    Chunks written once at ingestion time in a compact on-disk layout:
+
+        text.bin          UTF-8 chunk texts back to back
+        offsets.npy       n+1 byte offsets into text.bin
+        ids.npy           chunk IDs (fixed-width bytes)
+        hashes.npy        sha256 of each chunk text
+        source_index.npy  index into meta["sources"]
+        start_index.npy   character offset of the chunk in its source
+        meta.json         sources, per-file stat info and the set fingerprint
+
+    Everything is memory-mapped on open and chunk text is decoded only when
+    a chunk is actually read, so no list of Document objects sits on the heap.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(self._path(META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.sources: List[str] = meta["sources"]
+        self.files: Dict[str, dict] = meta["files"]
+        self.fingerprint: str = meta["fingerprint"]
+        self.offsets = np.load(self._path("offsets.npy"), mmap_mode="r")
+        self.chunk_ids = np.load(self._path("ids.npy"), mmap_mode="r")
+        self.hashes = np.load(self._path("hashes.npy"), mmap_mode="r")
+        self.source_index = np.load(self._path("source_index.npy"), mmap_mode="r")
+        self.start_index = np.load(self._path("start_index.npy"), mmap_mode="r")
+        self._text = b""
+        if os.path.getsize(self._path("text.bin")):
+            with open(self._path("text.bin"), "rb") as f:
+                self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._positions = None
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @classmethod
+    def open(cls, directory: str) -> Optional["ChunkStore"]:
+        """The store in directory, or None if there isn't a complete one"""
+        try:
+            return cls(directory)
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    @classmethod
+    def write(cls, directory: str, docs: List[Document], files: Optional[Dict[str, dict]] = None) -> "ChunkStore":
+        """Persist chunks produced by the splitter (with chunk_id/hash/source metadata) and open them"""
+        os.makedirs(directory, exist_ok=True)
+        encoded = [doc.page_content.encode("utf-8") for doc in docs]
+        offsets = np.zeros(len(docs) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in encoded], out=offsets[1:])
+
+        sources = sorted({doc.metadata["source"] for doc in docs})
+        source_lookup = {source: i for i, source in enumerate(sources)}
+        ids = [doc.metadata["chunk_id"] for doc in docs]
+        hashes = [doc.metadata["hash"] for doc in docs]
+        fingerprint = hashlib.sha256("\n".join(f"{i}:{h}" for i, h in zip(ids, hashes)).encode("utf-8")).hexdigest()
+
+        def replace(name, write):
+            tmp_path = os.path.join(directory, f"tmp.{name}")
+            write(tmp_path)
+            os.replace(tmp_path, os.path.join(directory, name))
+
+        def save_array(array):
+            def write(path):
+                with open(path, "wb") as f:
+                    np.save(f, array)
+            return write
+
+        def save_text(path):
+            with open(path, "wb") as f:
+                for text in encoded:
+                    f.write(text)
+
+        # Files already mapped by a running reader keep their old inode, meta.json goes last
+        replace("text.bin", save_text)
+        replace("offsets.npy", save_array(offsets))
+        replace("ids.npy", save_array(np.array(ids, dtype="S")))
+        replace("hashes.npy", save_array(np.array(hashes, dtype="S64")))
+        replace("source_index.npy", save_array(np.array([source_lookup[doc.metadata["source"]] for doc in docs], dtype=np.int32)))
+        replace("start_index.npy", save_array(np.array([doc.metadata.get("start_index", -1) for doc in docs], dtype=np.int64)))
+
+        def save_meta(path):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"sources": sources, "files": files or {}, "fingerprint": fingerprint}, f, ensure_ascii=False)
+        replace(META_FILE, save_meta)
+        return cls(directory)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._text) + sum(a.nbytes for a in (self.offsets, self.chunk_ids, self.hashes, self.source_index, self.start_index))
+
+    @property
+    def ids(self) -> List[str]:
+        return [chunk.decode("ascii") for chunk in self.chunk_ids]
+
+    def chunk_id(self, i: int) -> str:
+        return self.chunk_ids[i].decode("ascii")
+
+    def position(self, chunk_id: str) -> Optional[int]:
+        if self._positions is None:
+            self._positions = {chunk: i for i, chunk in enumerate(self.ids)}
+        return self._positions.get(chunk_id)
+
+    def source(self, i: int) -> str:
+        return self.sources[self.source_index[i]]
+
+    def hash(self, i: int) -> str:
+        return self.hashes[i].decode("ascii")
+
+    def text(self, i: int) -> str:
+        return self._text[int(self.offsets[i]):int(self.offsets[i + 1])].decode("utf-8")
+
+    def texts(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self.text(i)
+
+    def document(self, i: int) -> Document:
+        return Document(
+            page_content=self.text(i),
+            metadata={
+                "source": self.source(i),
+                "chunk_id": self.chunk_id(i),
+                "hash": self.hash(i),
+                "start_index": int(self.start_index[i]),
+            },
+        )
+
+    def document_by_id(self, chunk_id: str) -> Optional[Document]:
+        i = self.position(chunk_id)
+        return None if i is None else self.document(i)
+
+    def documents(self, source: Optional[str] = None) -> Iterator[Document]:
+        wanted = None if source is None else self.sources.index(source) if source in self.sources else -1
+        for i in range(len(self)):
+            if wanted is None or self.source_index[i] == wanted:
+                yield self.document(i)
@@ -0,0 +1,144 @@
+"""
+Compare the PyTorch and quantized ONNX embedding backends on the main.txt corpus.
+
+Each backend runs in its own subprocess so RSS numbers are not polluted by
+the other model. Reports load time, RSS, query latency and recall@k of the
+ONNX top-k against the PyTorch top-k (taken as ground truth).
+
+    python compare_embeddings.py --k 3 --out embedding_report.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+
+SAMPLE_QUERIES = [
+    "Даланзадгад сумын засаг дарга хэн бэ?",
+    "Өмнөговь аймаг хэдэн сумтай вэ?",
+    "Өмнөговь аймгийн хүн ам хэд вэ?",
+    "Аймгийн төв хаана байдаг вэ?",
+    "Өмнөговь аймаг ямар аймгуудтай хиллэдэг вэ?",
+]
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def load_chunks():
+    from langchain_community.document_loaders import TextLoader
+    from ingest import make_text_splitter
+
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    documents = TextLoader(os.path.join(current_dir, "data/files", "main.txt")).load()
+    return [doc.page_content for doc in make_text_splitter().split_documents(documents)]
+
+
+def build_queries(chunks):
+    # Hand-written questions plus the first line of every chunk as a pseudo query
+    pseudo = [chunk.strip().split("\n")[0][:120] for chunk in chunks]
+    return SAMPLE_QUERIES + [q for q in pseudo if q]
+
+
+def run_backend(backend: str, out_dir: str):
+    """Child process: embed corpus and queries with one backend and dump timings"""
+    from embeddings import load_embedding_model
+
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    onnx_dir = os.getenv("ONNX_MODEL_DIR", os.path.join(current_dir, "data/models", "multilingual-e5-large-onnx"))
+    chunks = load_chunks()
+    queries = build_queries(chunks)
+
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    model = load_embedding_model(backend, onnx_dir)
+    load_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    doc_vectors = np.asarray(model.embed_documents(chunks), dtype=np.float32)
+    corpus_seconds = time.perf_counter() - started
+
+    latencies = []
+    query_vectors = []
+    for query in queries:
+        started = time.perf_counter()
+        query_vectors.append(model.embed_query(query))
+        latencies.append(time.perf_counter() - started)
+
+    np.save(os.path.join(out_dir, f"{backend}_docs.npy"), doc_vectors)
+    np.save(os.path.join(out_dir, f"{backend}_queries.npy"), np.asarray(query_vectors, dtype=np.float32))
+    latencies_ms = np.asarray(latencies) * 1000
+    stats = {
+        "backend": backend,
+        "load_seconds": round(load_seconds, 3),
+        "rss_model_mb": round(rss_mb() - rss_before, 1),
+        "rss_total_mb": round(rss_mb(), 1),
+        "corpus_chunks": len(chunks),
+        "corpus_embed_seconds": round(corpus_seconds, 3),
+        "query_latency_ms": {
+            "p50": round(float(np.percentile(latencies_ms, 50)), 2),
+            "p95": round(float(np.percentile(latencies_ms, 95)), 2),
+            "mean": round(float(latencies_ms.mean()), 2),
+        },
+    }
+    with open(os.path.join(out_dir, f"{backend}_stats.json"), "w") as f:
+        json.dump(stats, f)
+
+
+def top_k(query_vectors, doc_vectors, k):
+    scores = query_vectors @ doc_vectors.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--out", default=None, help="write the JSON report here as well as stdout")
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    parser.add_argument("--work-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.backend:
+        run_backend(args.backend, args.work_dir)
+        return
+
+    work_dir = tempfile.mkdtemp(prefix="embed-compare-")
+    for backend in ("torch", "onnx"):
+        print(f"Running {backend} backend...", file=sys.stderr)
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--backend", backend, "--work-dir", work_dir],
+            check=True,
+        )
+
+    report = {"k": args.k, "backends": {}}
+    for backend in ("torch", "onnx"):
+        with open(os.path.join(work_dir, f"{backend}_stats.json")) as f:
+            report["backends"][backend] = json.load(f)
+
+    load = lambda name: np.load(os.path.join(work_dir, name))
+    truth = top_k(load("torch_queries.npy"), load("torch_docs.npy"), args.k)
+    candidate = top_k(load("onnx_queries.npy"), load("onnx_docs.npy"), args.k)
+    recall = [len(set(t) & set(c)) / args.k for t, c in zip(truth, candidate)]
+    report[f"recall@{args.k}"] = round(float(np.mean(recall)), 4)
+    # How far the quantized vectors drift from the fp32 ones for the same text
+    report["mean_doc_cosine"] = round(float(np.mean(np.sum(load("torch_docs.npy") * load("onnx_docs.npy"), axis=1))), 4)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    print(output)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,226 @@
+"""
+Write-behind consumer: moves chat messages from the Redis Stream into the
+`messages` table.
+
+Runs as one member of a consumer group, so several replicas can share the
+stream. Each loop reads up to BATCH_SIZE entries with XREADGROUP, inserts
+them in one transaction and XACKs them only after the commit. Entries left
+pending by a crashed consumer are reclaimed with XAUTOCLAIM once they have
+been idle for CLAIM_IDLE_MS; entries that keep failing are moved to a
+dead-letter stream after MAX_DELIVERIES attempts.
+
+The consumer name defaults to the hostname, so a restarted container
+rejoins under the same name and replays its own pending entries first.
+Set MESSAGE_CONSUMER_NAME when running several consumers on one host.
+Consumers that have been gone for CONSUMER_EXPIRE_MS with nothing pending
+are removed from the group.
+
+    python consumer/consumer_script.py                    # run forever
+    python consumer/consumer_script.py --drain            # stop once the stream is empty
+    python consumer/consumer_script.py --produce 100000   # load the stream with test events first
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+
 import redis
 
+# Run from the repository root or from the consumer image, which copies the shared modules next to this file
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from message_events import MESSAGE_STREAM, REDIS_URL, event_row, insert_messages, message_event  # noqa: E402
+
+
+GROUP = os.getenv("MESSAGE_CONSUMER_GROUP", "message-writers")
+CONSUMER = os.getenv("MESSAGE_CONSUMER_NAME", socket.gethostname())
+DEAD_LETTER_STREAM = f"{MESSAGE_STREAM}:dead"
+BATCH_SIZE = int(os.getenv("MESSAGE_BATCH_SIZE", "500"))
+BLOCK_MS = int(os.getenv("MESSAGE_BLOCK_MS", "1000"))
+CLAIM_IDLE_MS = int(os.getenv("MESSAGE_CLAIM_IDLE_MS", "60000"))
+MAX_DELIVERIES = int(os.getenv("MESSAGE_MAX_DELIVERIES", "5"))
+CONSUMER_EXPIRE_MS = int(os.getenv("MESSAGE_CONSUMER_EXPIRE_MS", str(24 * 3600 * 1000)))
+REPORT_SECONDS = float(os.getenv("MESSAGE_REPORT_SECONDS", "30"))
+
+
+def ensure_group(r: redis.Redis):
+    try:
+        r.xgroup_create(MESSAGE_STREAM, GROUP, id="0", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def dead_letter(r: redis.Redis, entry_id: str, fields: dict, reason: str):
+    print(f"Dead-lettering {entry_id}: {reason}")
+    pipe = r.pipeline()
+    pipe.xadd(DEAD_LETTER_STREAM, {**(fields or {}), "entry_id": entry_id, "reason": reason[:500]})
+    pipe.xack(MESSAGE_STREAM, GROUP, entry_id)
+    pipe.execute()
 
-r = redis.Redis(host="redis", port=6379, decode_responses=True)
 
-def get_db():
+def write_batch(r: redis.Redis, SessionLocal, entries) -> int:
+    """Insert one batch and ack what was committed, returns the number persisted"""
+    rows, ids = [], []
+    for entry_id, fields in entries:
+        if not fields:
+            # Pending entries deleted by stream trimming come back without fields
+            dead_letter(r, entry_id, fields, "entry trimmed from the stream before it was written")
+            continue
+        try:
+            rows.append(event_row(fields))
+            ids.append(entry_id)
+        except (KeyError, TypeError, ValueError) as e:
+            dead_letter(r, entry_id, fields, f"malformed event: {e!r}")
+    if not rows:
+        return 0
+
     db = SessionLocal()
     try:
-        yield db
+        insert_messages(db, rows)
+        db.commit()
+        r.xack(MESSAGE_STREAM, GROUP, *ids)
+        return len(ids)
+    except Exception as e:
+        db.rollback()
+        print(f"Batch of {len(ids)} failed ({e}), retrying entries one by one")
     finally:
         db.close()
 
-def consume_events():
-    last_id = "0"  # Start from the beginning
+    # Isolate the bad entries; the rest are acked, failures stay pending for XAUTOCLAIM
+    written = 0
+    for entry_id, row in zip(ids, rows):
+        db = SessionLocal()
+        try:
+            insert_messages(db, [row])
+            db.commit()
+            r.xack(MESSAGE_STREAM, GROUP, entry_id)
+            written += 1
+        except Exception as e:
+            db.rollback()
+            print(f"Entry {entry_id} failed: {e}")
+        finally:
+            db.close()
+    return written
+
+
+def reclaim(r: redis.Redis, SessionLocal) -> int:
+    """Take over entries another consumer (or an earlier failure) left pending"""
+    written = 0
+    start = "0-0"
+    while True:
+        start, entries, *_ = r.xautoclaim(MESSAGE_STREAM, GROUP, CONSUMER, CLAIM_IDLE_MS, start_id=start, count=BATCH_SIZE)
+        if entries:
+            # Trimmed entries (no fields) are dead-lettered by write_batch
+            ids = [entry_id for entry_id, _ in entries]
+            deliveries = {
+                item["message_id"]: item["times_delivered"]
+                for item in r.xpending_range(MESSAGE_STREAM, GROUP, min=ids[0], max=ids[-1], count=len(ids))
+            } if ids else {}
+            retry = []
+            for entry_id, fields in entries:
+                if deliveries.get(entry_id, 0) > MAX_DELIVERIES:
+                    dead_letter(r, entry_id, fields, f"failed {deliveries[entry_id]} deliveries")
+                else:
+                    retry.append((entry_id, fields))
+            written += write_batch(r, SessionLocal, retry)
+        if start in ("0-0", b"0-0"):
+            return written
+
+
+def prune_consumers(r: redis.Redis) -> int:
+    """Remove group members that have been idle for CONSUMER_EXPIRE_MS with nothing pending"""
+    removed = 0
+    for consumer in r.xinfo_consumers(MESSAGE_STREAM, GROUP):
+        # "inactive" (Redis 7.2+) counts from the last read attempt, "idle" from the last delivery
+        idle = consumer.get("inactive", consumer["idle"])
+        if consumer["name"] != CONSUMER and consumer["pending"] == 0 and idle >= CONSUMER_EXPIRE_MS:
+            r.xgroup_delconsumer(MESSAGE_STREAM, GROUP, consumer["name"])
+            removed += 1
+    if removed:
+        print(f"Removed {removed} expired consumers from {GROUP}")
+    return removed
+
+
+def lag(r: redis.Redis) -> dict:
+    for group in r.xinfo_groups(MESSAGE_STREAM):
+        if group["name"] == GROUP:
+            # "lag" (entries not yet delivered to the group) needs Redis 7+
+            return {"pending": group["pending"], "lag": group.get("lag")}
+    return {"pending": 0, "lag": None}
+
+
+def produce(r: redis.Redis, count: int, session_id: str):
+    """Fill the stream with synthetic events to measure throughput"""
+    pipe = r.pipeline(transaction=False)
+    for i in range(count):
+        pipe.xadd(MESSAGE_STREAM, message_event(session_id, f"load test message {i}", is_from_user=i % 2 == 0))
+        if i % 1000 == 999:
+            pipe.execute()
+    pipe.execute()
+    print(f"Produced {count} events into {MESSAGE_STREAM}")
+
+
+def consume_events(drain: bool = False):
+    from database import SessionLocal
+
+    r = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+    ensure_group(r)
+    print(f"Consumer {CONSUMER} reading {MESSAGE_STREAM} as group {GROUP}")
+
+    started = last_report = last_claim = time.monotonic()
+    total = since_report = 0
+    # Our own pending entries from a previous run come first, then new ones (">")
+    position = "0"
     while True:
-        # Blocking read from Redis Stream
-        events = r.xread({"messages": last_id}, block=0, count=1)
-        if events:
-            stream, messages = events[0]
-            for message_id, message_data in messages:
-                try:
-                    db = get_db()
-                    new_message = MessageModel(session_id=message_data.session_id, text=message_data.text, is_from_user=message_data.is_from_user)
-                    db.add(new_message)
-                    db.commit()
-                    db.refresh(new_message)
-                    
-                    last_id = message_id  # Update last_id to avoid reprocessing
-                except Exception as e:
-                    print(f"got error while saving into database: {e}")
+        now = time.monotonic()
+        if now - last_claim >= CLAIM_IDLE_MS / 1000:
+            claimed = reclaim(r, SessionLocal)
+            prune_consumers(r)
+            total += claimed
+            since_report += claimed
+            last_claim = now
+
+        events = r.xreadgroup(GROUP, CONSUMER, {MESSAGE_STREAM: position}, count=BATCH_SIZE, block=None if position != ">" else BLOCK_MS)
+        entries = events[0][1] if events else []
+        if position != ">":
+            if not entries:
+                position = ">"
+                continue
+            # Entries that fail again stay pending, move past them
+            position = entries[-1][0]
+        written = write_batch(r, SessionLocal, entries)
+        total += written
+        since_report += written
+
+        now = time.monotonic()
+        if now - last_report >= REPORT_SECONDS or (drain and not entries):
+            print(
+                f"{since_report / (now - last_report):.0f} msg/s over the last {now - last_report:.0f}s, "
+                f"{total} total, {lag(r)}"
+            )
+            last_report = now
+            since_report = 0
+        if drain and not entries:
+            elapsed = time.monotonic() - started
+            print(f"Drained: {total} messages in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.0f} msg/s)")
+            return
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drain", action="store_true", help="exit once no new entries arrive")
+    parser.add_argument("--produce", type=int, default=0, help="XADD this many synthetic events first")
+    parser.add_argument("--session-id", help="existing session the synthetic events belong to")
+    args = parser.parse_args()
+
+    if args.produce:
+        if not args.session_id:
+            parser.error("--produce needs --session-id (messages reference sessions)")
+        produce(redis.Redis.from_url(REDIS_URL, decode_responses=True), args.produce, args.session_id)
+    consume_events(drain=args.drain)
+
 
 if __name__ == "__main__":
-    consume_events()
\ No newline at end of file
+    main()
@@ -0,0 +1,102 @@
+import math
+import asyncio
+from typing import Callable, Dict, List
+
+from cache import TTLCache
+
+
+# DeepSeek's tokenizer isn't available offline; Mongolian Cyrillic runs at
+# roughly 2-3 characters per token, so 2 keeps the estimate on the safe side
+CHARS_PER_TOKEN = 2
+# Role/formatting overhead the chat template adds per message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def message_tokens(message: Dict[str, str]) -> int:
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def trim_to_budget(messages: List[Dict[str, str]], budget_tokens: int) -> List[Dict[str, str]]:
+    """Newest messages whose estimated size fits the budget, in chronological order"""
+    kept = []
+    used = 0
+    for message in reversed(messages):
+        used += message_tokens(message)
+        if used > budget_tokens:
+            break
+        kept.append(message)
+    kept.reverse()
+    return kept
+
+
+def load_session_messages(session_id, exclude_id=None, limit: int = 50) -> List[Dict[str, str]]:
+    """Latest messages of a chat session from the messages table, oldest first, without `exclude_id`"""
+    from database import SessionLocal
+    from models import Message
+
+    db = SessionLocal()
+    try:
+        query = db.query(Message.text, Message.is_from_user).filter(Message.session_id == session_id)
+        if exclude_id is not None:
+            query = query.filter(Message.id != exclude_id)
+        rows = (
+            query
+            .order_by(Message.timestamp.desc())
+            .limit(limit)
+            .all()
+        )
+    finally:
+        db.close()
+    return [
+        {"role": "user" if row.is_from_user else "assistant", "content": row.text}
+        for row in reversed(rows)
+    ]
+
+
+class ConversationMemory:
+    """
+    Chat history per session, bounded by a token budget.
+
+    A session's history is loaded from the messages table the first time it
+    is needed and then kept in an LRU+TTL cache, new turns are appended in
+    place. Both the cached history and what goes into a completion are
+    trimmed to `budget_tokens`, so prompt size stays flat however long a
+    conversation or the server runs.
+    """
+
+    def __init__(self, budget_tokens: int = 1500, maxsize: int = 1024, ttl: float = 3600,
+                 load_messages: Callable = load_session_messages):
+        self.budget_tokens = budget_tokens
+        self.load_messages = load_messages
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl, name="conversation_history")
+
+    async def history(self, session_id, exclude_id=None) -> List[Dict[str, str]]:
+        """
+        History before the current turn. `exclude_id` is the id of the message
+        being answered, which the write-behind consumer may already have
+        stored; it goes into the prompt as the question, not as history.
+        """
+        if session_id is None:
+            return []
+        key = str(session_id)
+        messages = self.cache.get(key)
+        if messages is None:
+            try:
+                messages = await asyncio.to_thread(self.load_messages, session_id, exclude_id)
+            except Exception as e:
+                print(f"Could not load history for session {key}: {e}")
+                messages = []
+            messages = trim_to_budget(messages, self.budget_tokens)
+            self.cache.set(key, messages)
+        return list(messages)
+
+    def append(self, session_id, *messages: Dict[str, str]):
+        if session_id is None:
+            return
+        key = str(session_id)
+        history = self.cache.get(key) or []
+        self.cache.set(key, trim_to_budget([*history, *messages], self.budget_tokens))
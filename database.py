@@ -1,14 +1,107 @@
 import os
-from sqlalchemy import create_engine
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from sqlalchemy.ext.declarative import declarative_base
 from dotenv import load_dotenv
 
+from metrics import Counter, Gauge, Histogram
+from observability import current_route
+
 load_dotenv()
 
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "SQL statement execution time per API route",
+    labelnames=("route",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection, per pool (async for routes, sync for workers)",
+    labelnames=("pool",),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+DB_POOL_TIMEOUTS = Counter("db_pool_checkout_timeouts_total", "Checkouts that gave up after DB_POOL_TIMEOUT", labelnames=("pool",))
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Connections currently checked out of the pool", labelnames=("pool",))
+DB_POOL_CAPACITY = Gauge("db_pool_capacity", "Connections the pool may open, pool size plus overflow", labelnames=("pool",))
+
+# Per process; with N workers the database sees up to N * (size + overflow) connections
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Recycle before server or proxy idle timeouts close connections under us
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+
+def _timed_checkout(pool_class, label: str):
+    """Pool subclass that records how long each checkout waited and whether it timed out"""
+
+    class TimedPool(pool_class):
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                return super()._do_get()
+            except PoolTimeout:
+                DB_POOL_TIMEOUTS.labels(label).inc()
+                raise
+            finally:
+                DB_POOL_WAIT.labels(label).observe(time.perf_counter() - started)
+
+    TimedPool.__name__ = f"Timed{pool_class.__name__}"
+    return TimedPool
+
+
+TimedQueuePool = _timed_checkout(QueuePool, "sync")
+TimedAsyncQueuePool = _timed_checkout(AsyncAdaptedQueuePool, "async")
+
+
+def async_database_url(url: str) -> str:
+    """The asyncpg (or aiosqlite) flavour of the URL, ASYNC_URL_DATABASE overrides it"""
+    scheme, sep, rest = url.partition("://")
+    if scheme in ("postgres", "postgresql", "postgresql+psycopg2"):
+        return f"postgresql+asyncpg{sep}{rest}"
+    if scheme == "sqlite":
+        return f"sqlite+aiosqlite{sep}{rest}"
+    return url
+
+
+def _pool_options() -> dict:
+    options = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    if not URL_DATABASE.startswith("sqlite"):
+        options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    return options
+
+
+def _instrument(sync_engine, label: str):
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _query_started(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _query_finished(conn, cursor, statement, parameters, context, executemany):
+        DB_QUERY_SECONDS.labels(current_route()).observe(time.perf_counter() - context._query_started)
+
+    pool = sync_engine.pool
+    DB_POOL_CHECKED_OUT.labels(label).set_function(pool.checkedout)
+    DB_POOL_CAPACITY.labels(label).set_function(lambda: pool.size() + max(pool._max_overflow, 0))
+
+
 URL_DATABASE = os.getenv("URL_DATABASE")
-engine = create_engine(URL_DATABASE)
+ASYNC_URL_DATABASE = os.getenv("ASYNC_URL_DATABASE") or async_database_url(URL_DATABASE)
+
+# Sync engine for code running in worker threads, scripts, the consumer and migrations
+engine = create_engine(URL_DATABASE, poolclass=TimedQueuePool, **_pool_options())
+_instrument(engine, "sync")
+
+# Request handlers use the async engine so queries never block the event loop
+async_engine = create_async_engine(ASYNC_URL_DATABASE, poolclass=TimedAsyncQueuePool, **_pool_options())
+_instrument(async_engine.sync_engine, "async")
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Objects stay usable after commit, handlers return them once the session is gone
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
@@ -0,0 +1,220 @@
+import os
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_community.embeddings import HuggingFaceEmbeddings
+
+from cache import TTLCache, normalize_query
+from metrics import Histogram
+
+
+EMBEDDING_MODEL = "intfloat/multilingual-e5-large"
+EMBEDDING_BACKENDS = ("torch", "onnx")
+
+
+def embedding_signature(backend: str) -> str:
+    """Identifies which model/backend produced stored vectors, a change forces a re-index"""
+    precision = "fp32" if backend == "torch" else "onnx-int8"
+    return f"{EMBEDDING_MODEL}:{precision}"
+
+
+def export_onnx_model(model_name: str, model_dir: str, quantize: bool = True):
+    """Export the model to ONNX and apply dynamic int8 quantization"""
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    print(f"Exporting {model_name} to ONNX in {model_dir}...")
+    model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+    model.save_pretrained(model_dir)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(model_dir)
+
+    if quantize:
+        quantizer = ORTQuantizer.from_pretrained(model)
+        qconfig = AutoQuantizationConfig.avx2(is_static=False, per_channel=True)
+        quantizer.quantize(save_dir=model_dir, quantization_config=qconfig)
+    print("\n--- Finished exporting ONNX model ---")
+
+
+class OnnxE5Embeddings(Embeddings):
+    """
+    The same e5 model run through onnxruntime, int8-quantized by default.
+
+    Mirrors the sentence-transformers pipeline (mean pooling over the
+    attention mask, then L2 normalization) so vectors stay comparable
+    with the PyTorch backend.
+    """
+
+    def __init__(self, model_name: str, model_dir: str, quantize: bool = True, batch_size: int = 16, max_length: int = 512):
+        try:
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ImportError(
+                "EMBEDDING_BACKEND=onnx needs onnxruntime, install it with pip install -r requirements-onnx.txt"
+            ) from e
+
+        model_file = os.path.join(model_dir, "model_quantized.onnx" if quantize else "model.onnx")
+        if not os.path.exists(model_file):
+            export_onnx_model(model_name, model_dir, quantize)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            encoded = self.tokenizer(
+                texts[start:start + self.batch_size],
+                padding=True, truncation=True, max_length=self.max_length, return_tensors="np",
+            )
+            feeds = {name: value.astype(np.int64) for name, value in encoded.items() if name in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.linalg.norm(pooled, axis=1, keepdims=True)
+            vectors.extend(pooled.tolist())
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._encode(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0]
+
+
+def load_embedding_model(backend: str = "torch", onnx_dir: Optional[str] = None) -> Embeddings:
+    if backend == "torch":
+        return HuggingFaceEmbeddings(
+            model_name=EMBEDDING_MODEL,
+            model_kwargs={"device": "cpu"},
+            encode_kwargs={"normalize_embeddings": True}  # Crucial for accuracy
+        )
+    if backend == "onnx":
+        return OnnxE5Embeddings(EMBEDDING_MODEL, onnx_dir)
+    raise ValueError(f"Unknown embedding backend '{backend}', expected one of {EMBEDDING_BACKENDS}")
+
+
+EMBED_BATCH_SIZE = Histogram(
+    "rag_embed_batch_size", "Queries encoded per batched forward pass",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+EMBED_QUEUE_WAIT = Histogram(
+    "rag_embed_queue_wait_seconds", "Time a query waited before its batch started encoding",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+
+class EmbeddingBatcher:
+    """
+    Collects concurrent query-embedding requests for up to `max_wait_ms`, or
+    until `max_batch_size` are waiting, and encodes them in one forward pass.
+
+    Each caller awaits its own future and gets back only its vector.
+    """
+
+    def __init__(self, model: Embeddings, max_batch_size: int = 16, max_wait_ms: float = 5):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        # One encode at a time, a single CPU gains nothing from overlapping batches
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed-batch")
+        self._queue = None
+        self._worker = None
+        self._loop = None
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def embed(self, text: str) -> List[float]:
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((text, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Callers that already gave up (stage timeout) don't need encoding
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            EMBED_BATCH_SIZE.observe(len(batch))
+            for _, _, enqueued in batch:
+                EMBED_QUEUE_WAIT.observe(started - enqueued)
+
+            texts = [text for text, _, _ in batch]
+            try:
+                vectors = await self._loop.run_in_executor(self.executor, self.model.embed_documents, texts)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future, _), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Wraps an embedding model and caches query vectors by normalized query text.
+
+    Document embedding is passed straight through, only the per-request
+    query path is cached since that is what citizens repeat all day.
+    """
+
+    def __init__(self, model: Embeddings, maxsize: int = 1024, ttl: float = 3600, batcher: Optional[EmbeddingBatcher] = None):
+        self.model = model
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl, name="query_embeddings")
+        self.batcher = batcher
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.model.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.model.embed_query(text)
+            self.cache.set(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            if self.batcher is not None:
+                vector = await self.batcher.embed(text)
+            else:
+                vector = await asyncio.get_running_loop().run_in_executor(None, self.model.embed_query, text)
+            self.cache.set(key, vector)
+        return vector
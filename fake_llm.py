@@ -0,0 +1,136 @@
+"""
+Local stand-in for an OpenAI-compatible chat-completions API, for load
+testing without spending DeepSeek tokens or needing network access.
+
+    python fake_llm.py --port 8090 --ttft 0.4 --tps 40 --error-rate 0.02
+    LLM_BASE_URL=http://localhost:8090 uvicorn main:app
+
+Streamed responses send one role chunk, then `--tokens` content chunks at
+`--tps` after a `--ttft` delay, then a usage chunk if the client asked for
+stream_options.include_usage. `--error-rate` of the requests fail with a 429
+or 503 before anything is streamed, the way a throttled provider does.
+"""
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+# Plain Mongolian words, so token counts and text sizes look like real answers
+WORDS = (
+    "Сайн байна уу. Таны хүсэлтийг хүлээн авлаа. Энэ асуудлаар сумын засаг даргын "
+    "тамгын газарт хандана уу. Бичиг баримтаа бүрдүүлж ирснээр үйлчилгээ авах боломжтой."
+).split()
+
+CONFIG = {
+    "ttft": float(os.getenv("FAKE_LLM_TTFT", "0.4")),
+    "tps": float(os.getenv("FAKE_LLM_TPS", "40")),
+    "tokens": int(os.getenv("FAKE_LLM_TOKENS", "120")),
+    "error_rate": float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+    # Share of each prompt reported as a prefix-cache hit in usage
+    "cache_hit_ratio": float(os.getenv("FAKE_LLM_CACHE_HIT_RATIO", "0.6")),
+}
+
+app = FastAPI()
+
+
+def _usage(messages) -> dict:
+    # Same rough estimate as conversation.py, good enough for accounting
+    prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 2
+    hit = int(prompt_tokens * CONFIG["cache_hit_ratio"]) // 64 * 64
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": CONFIG["tokens"],
+        "total_tokens": prompt_tokens + CONFIG["tokens"],
+        "prompt_cache_hit_tokens": hit,
+        "prompt_cache_miss_tokens": prompt_tokens - hit,
+    }
+
+
+def _chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+    body = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(body, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat/completions")
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "deepseek-chat")
+    messages = body.get("messages", [])
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+    if random.random() < CONFIG["error_rate"]:
+        status = random.choice((429, 503))
+        return JSONResponse(
+            status_code=status,
+            content={"error": {"message": "Simulated provider error", "type": "fake_llm", "code": status}},
+            headers={"Retry-After": "1"} if status == 429 else None,
+        )
+
+    words = [random.choice(WORDS) for _ in range(CONFIG["tokens"])]
+    if not body.get("stream"):
+        await asyncio.sleep(CONFIG["ttft"] + CONFIG["tokens"] / CONFIG["tps"])
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}],
+            "usage": _usage(messages),
+        }
+
+    include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+    async def stream():
+        yield _chunk(completion_id, model, {"role": "assistant", "content": ""})
+        await asyncio.sleep(CONFIG["ttft"])
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(1 / CONFIG["tps"])
+            yield _chunk(completion_id, model, {"content": word if i == 0 else f" {word}"})
+        yield _chunk(completion_id, model, {}, finish_reason="stop")
+        if include_usage:
+            usage = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [], "usage": _usage(messages)}
+            yield f"data: {json.dumps(usage)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+@app.get("/config")
+async def get_config():
+    return CONFIG
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--ttft", type=float, default=CONFIG["ttft"], help="seconds before the first token")
+    parser.add_argument("--tps", type=float, default=CONFIG["tps"], help="tokens per second after the first")
+    parser.add_argument("--tokens", type=int, default=CONFIG["tokens"], help="tokens per answer")
+    parser.add_argument("--error-rate", type=float, default=CONFIG["error_rate"], help="share of requests failing with 429/503")
+    args = parser.parse_args()
+
+    CONFIG.update(ttft=args.ttft, tps=args.tps, tokens=args.tokens, error_rate=args.error_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
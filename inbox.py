@@ -0,0 +1,174 @@
+"""
+Complaint inbox projection: one `complaint_inbox` row per complaint session
+with its first message, owner, message count, last activity and status.
+
+The row is created with the session (open_complaint) and updated whenever
+messages are inserted (apply_messages, called by message_events.insert_messages
+for both the stream consumer and the direct-write fallback), so listing the
+inbox never touches `messages`.
+
+    python inbox.py backfill   # (re)build rows for existing complaint sessions
+
+The backfill overwrites rows from a snapshot of `messages`; run it while the
+consumer is stopped, or messages written meanwhile are missing from the counts.
+"""
+import argparse
+from datetime import datetime
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from sqlalchemy import case, literal, or_, select, update
+
+from models import ComplaintInbox, ComplaintStatus, Message, Session, SessionType, User
+
+
+def message_status(is_from_user: bool, assigned_to) -> Optional[ComplaintStatus]:
+    """Status a message leaves its complaint in, None when it doesn't change it"""
+    if is_from_user:
+        return ComplaintStatus.OPEN
+    if assigned_to is not None:
+        # Staff replies are assigned to the staff member, model answers are not
+        return ComplaintStatus.ANSWERED
+    return None
+
+
+def open_complaint(db, session: Session, user: User):
+    """Add the inbox row in the transaction that creates the complaint session"""
+    db.add(ComplaintInbox(
+        session_id=session.id,
+        user_id=user.id,
+        email=user.email,
+        name=user.name,
+        message_count=0,
+        status=ComplaintStatus.OPEN,
+        created_at=session.started_at,
+        last_activity_at=session.started_at,
+    ))
+
+
+def _summaries(messages) -> Dict:
+    """Per session: first and last message and count of the given messages"""
+    by_session = defaultdict(list)
+    for message in messages:
+        by_session[message.session_id].append(message)
+    summaries = {}
+    for session_id, rows in by_session.items():
+        rows.sort(key=lambda row: (row.timestamp, row.id))
+        summaries[session_id] = (rows[0], rows[-1], len(rows))
+    return summaries
+
+
+def apply_messages(db, messages: List):
+    """
+    Fold newly inserted messages into their sessions' inbox rows, in the
+    caller's transaction. `messages` need id, session_id, text, is_from_user,
+    assigned_to and timestamp; only rows that were actually inserted may be
+    passed, or redelivered messages would be counted twice.
+    """
+    summaries = _summaries(messages)
+    if not summaries:
+        return
+    complaints = db.execute(
+        select(ComplaintInbox.session_id).where(ComplaintInbox.session_id.in_(list(summaries)))
+    ).scalars().all()
+
+    inbox = ComplaintInbox
+    for session_id in complaints:
+        first, last, count = summaries[session_id]
+        # Consumers may apply batches out of order, so compare instead of overwrite
+        earlier = or_(inbox.first_message_at.is_(None), inbox.first_message_at > first.timestamp)
+        later = inbox.last_activity_at <= last.timestamp
+        values = {
+            "message_count": inbox.message_count + count,
+            "first_message_id": case((earlier, first.id), else_=inbox.first_message_id),
+            "first_message": case((earlier, first.text), else_=inbox.first_message),
+            "first_message_at": case((earlier, first.timestamp), else_=inbox.first_message_at),
+            "last_activity_at": case((later, last.timestamp), else_=inbox.last_activity_at),
+        }
+        status = message_status(last.is_from_user, last.assigned_to)
+        if status is not None:
+            values["status"] = case((later, literal(status, inbox.status.type)), else_=inbox.status)
+        db.execute(
+            update(inbox).where(inbox.session_id == session_id).values(**values)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def backfill(db, batch: int = 500) -> int:
+    """Rebuild the inbox rows of every complaint session from `messages`, batch by batch"""
+    if db.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    total = 0
+    after = None
+    while True:
+        query = (
+            select(Session.id, Session.user_id, Session.started_at, User.email, User.name)
+            .join(User, User.id == Session.user_id, isouter=True)
+            .where(Session.type == SessionType.COMPLAIN)
+        )
+        if after is not None:
+            query = query.where(Session.id > after)
+        sessions = db.execute(query.order_by(Session.id).limit(batch)).all()
+        if not sessions:
+            return total
+        after = sessions[-1].id
+
+        messages = db.execute(
+            select(
+                Message.id, Message.session_id, Message.text, Message.is_from_user,
+                Message.assigned_to, Message.timestamp,
+            ).where(Message.session_id.in_([session.id for session in sessions]))
+        ).all()
+        summaries = _summaries(messages)
+
+        rows = []
+        for session in sessions:
+            first, last, count = summaries.get(session.id, (None, None, 0))
+            # Rows from before started_at had a working default may lack it
+            created_at = session.started_at or (first.timestamp if first else datetime.now())
+            status = ComplaintStatus.OPEN
+            if last is not None:
+                status = message_status(last.is_from_user, last.assigned_to) or ComplaintStatus.OPEN
+            rows.append({
+                "session_id": session.id,
+                "user_id": session.user_id,
+                "email": session.email,
+                "name": session.name,
+                "first_message_id": first.id if first else None,
+                "first_message": first.text if first else None,
+                "first_message_at": first.timestamp if first else None,
+                "message_count": count,
+                "status": status,
+                "created_at": created_at,
+                "last_activity_at": last.timestamp if last else created_at,
+            })
+        statement = insert(ComplaintInbox).values(rows)
+        db.execute(statement.on_conflict_do_update(
+            index_elements=["session_id"],
+            set_={column: statement.excluded[column] for column in rows[0] if column != "session_id"},
+        ))
+        db.commit()
+        total += len(rows)
+        print(f"Backfilled {total} complaint sessions")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("backfill",))
+    parser.add_argument("--batch", type=int, default=500, help="complaint sessions per transaction")
+    args = parser.parse_args()
+
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        print(f"Done, {backfill(db, args.batch)} inbox rows written")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
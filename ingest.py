@@ -0,0 +1,265 @@
+"""
+Incremental ingestion of everything under data/files into the vector store.
+
+Every file is split with the same splitter the RAG pipeline uses and each
+chunk gets a content-derived ID. A manifest next to the vector store
+records which chunks are already embedded, so a run only embeds added
+chunks and deletes chunks whose text disappeared.
+
+Chunks are persisted in a memory-mapped chunk store (see chunk_store.py)
+together with each file's size and mtime, so a startup where no file
+changed doesn't read or split anything.
+
+    python ingest.py            # apply changes
+    python ingest.py --dry-run  # only report what would change
+"""
+import os
+import json
+import shutil
+import hashlib
+import argparse
+import tempfile
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import chromadb
+from langchain_chroma import Chroma
+from langchain_community.document_loaders import TextLoader
+from langchain_core.documents import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from chunk_store import ChunkStore
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FILES_DIR = os.path.join(BASE_DIR, "data/files")
+DB_DIR = os.path.join(BASE_DIR, "data/db")
+CHROMA_DIR = os.path.join(DB_DIR, "chroma_db")
+MANIFEST_PATH = os.path.join(DB_DIR, "ingest_manifest.json")
+CHUNKS_DIR = os.path.join(DB_DIR, "chunks")
+MANIFEST_VERSION = 1
+UPSERT_BATCH = 64
+CHROMA_MEMORY_LIMIT = int(float(os.getenv("CHROMA_MEMORY_LIMIT_MB", "0")) * 1024 * 1024)
+# "chroma" or "numpy" (memory-mapped flat matrix, see vector_index.py)
+VECTOR_STORE = os.getenv("VECTOR_STORE", "chroma")
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float16")
+NUMPY_INDEX_DIR = os.path.join(DB_DIR, "numpy_index")
+
+
+def make_text_splitter():
+    return RecursiveCharacterTextSplitter(
+        chunk_size=300,       # Smaller chunks for agglutinative languages
+        chunk_overlap=50,     # Overlap to preserve context
+        separators=["\n\n", "\n", "。", " ", ""],  # Mongolian-specific separators
+        add_start_index=True,
+    )
+
+
+def store_signature(embedding_signature: str) -> str:
+    """Manifest signature, a different store type must not trust the other one's manifest"""
+    if VECTOR_STORE == "numpy":
+        from vector_index import FORMAT
+        return f"{embedding_signature}|numpy-{VECTOR_DTYPE}-v{FORMAT}"
+    return embedding_signature
+
+
+def open_vector_store(embeddings, persist_directory: str = CHROMA_DIR, collection_name: str = "langchain"):
+    if VECTOR_STORE == "numpy":
+        from vector_index import NumpyVectorStore
+        return NumpyVectorStore(os.path.join(NUMPY_INDEX_DIR, collection_name), embeddings, VECTOR_DTYPE)
+    return Chroma(
+        collection_name=collection_name,
+        persist_directory=persist_directory,
+        embedding_function=embeddings,
+        client_settings=chromadb.config.Settings(
+            anonymized_telemetry=False,
+            is_persistent=True,
+            # Let Chroma unload HNSW segments of tenant collections nobody is querying
+            chroma_segment_cache_policy="LRU" if CHROMA_MEMORY_LIMIT else None,
+            chroma_memory_limit_bytes=CHROMA_MEMORY_LIMIT,
+        )
+    )
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def scan_sources(files_dir: str = FILES_DIR) -> List[str]:
+    """Relative paths of every non-hidden file under files_dir, in a stable order"""
+    sources = []
+    for root, dirs, files in os.walk(files_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(files):
+            if not name.startswith("."):
+                sources.append(os.path.relpath(os.path.join(root, name), files_dir))
+    return sources
+
+
+def file_stat(files_dir: str, source: str) -> dict:
+    stat = os.stat(os.path.join(files_dir, source))
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def split_text(text: str, source: str, splitter=None) -> List[Document]:
+    """Chunk a piece of text and attach source/chunk_id/hash metadata"""
+    splitter = splitter or make_text_splitter()
+    chunks = splitter.create_documents([text])
+
+    seen = {}
+    for doc in chunks:
+        digest = content_hash(doc.page_content)
+        # IDs come from the text itself so unchanged chunks keep their ID when
+        # text is inserted above them; repeats within a source get a counter
+        base = hashlib.sha256(f"{source}\0{digest}".encode("utf-8")).hexdigest()[:32]
+        occurrence = seen.get(base, 0)
+        seen[base] = occurrence + 1
+        doc.metadata = {
+            "source": source,
+            "chunk_id": base if occurrence == 0 else f"{base}-{occurrence}",
+            "hash": digest,
+            "start_index": doc.metadata.get("start_index", -1),
+        }
+    return chunks
+
+
+def split_source(files_dir: str, source: str, splitter=None) -> List[Document]:
+    """Chunk one file under files_dir"""
+    documents = TextLoader(os.path.join(files_dir, source)).load()
+    return split_text(documents[0].page_content, source, splitter)
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+    except (FileNotFoundError, ValueError):
+        pass
+    return {"version": MANIFEST_VERSION, "embedding": None, "chunks": {}}
+
+
+def save_manifest(manifest: dict, path: str = MANIFEST_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+@dataclass
+class IngestResult:
+    chunks: Optional[ChunkStore] = None
+    embedded: int = 0
+    skipped: int = 0
+    deleted: int = 0
+    reindexed: bool = False
+    resplit: int = 0
+
+    def summary(self) -> str:
+        return (
+            f"{len(self.chunks) if self.chunks is not None else 0} chunks: {self.embedded} embedded, "
+            f"{self.skipped} skipped, {self.deleted} deleted, {self.resplit} files split"
+            + (" (full re-index)" if self.reindexed else "")
+        )
+
+
+def sync_chunks(store, signature: str, chunks: ChunkStore, manifest_path: str, dry_run: bool = False) -> IngestResult:
+    """
+    Bring the vector store in line with the chunk store using the manifest at manifest_path.
+
+    A manifest written by a different embedding backend, or a store without
+    a manifest at all, can't be trusted chunk by chunk, so the collection is
+    reset and everything is embedded again.
+    """
+    manifest = load_manifest(manifest_path)
+    result = IngestResult(chunks=chunks)
+    if manifest["embedding"] != signature:
+        result.reindexed = True
+        known: Dict[str, dict] = {}
+    else:
+        known = manifest["chunks"]
+
+    current = {chunk: i for i, chunk in enumerate(chunks.ids)}
+    added = [i for chunk, i in current.items() if chunk not in known]
+    removed = [chunk for chunk in known if chunk not in current]
+    result.embedded = len(added)
+    result.skipped = len(current) - len(added)
+    result.deleted = len(removed)
+
+    if dry_run:
+        return result
+
+    if result.reindexed:
+        print("Vector store has no matching manifest, re-indexing everything...")
+        store.reset_collection()
+    if removed:
+        store.delete(ids=removed)
+    for start in range(0, len(added), UPSERT_BATCH):
+        # Only the chunks being embedded are decoded into Documents
+        batch = [chunks.document(i) for i in added[start:start + UPSERT_BATCH]]
+        store.add_documents(batch, ids=[doc.metadata["chunk_id"] for doc in batch])
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "embedding": signature,
+        "chunks": {
+            chunk: {"source": chunks.source(i), "hash": chunks.hash(i)}
+            for chunk, i in current.items()
+        },
+    }
+    save_manifest(manifest, manifest_path)
+    return result
+
+
+def ingest(store, signature: str, files_dir: str = FILES_DIR, manifest_path: str = MANIFEST_PATH,
+           chunks_dir: str = CHUNKS_DIR, dry_run: bool = False) -> IngestResult:
+    """Bring the chunk store and the vector store in line with every file under files_dir"""
+    previous = ChunkStore.open(chunks_dir)
+    stats = {source: file_stat(files_dir, source) for source in scan_sources(files_dir)}
+    if previous is not None and previous.files == stats:
+        return sync_chunks(store, signature, previous, manifest_path, dry_run)
+
+    # Only files whose size or mtime changed are read and split again
+    splitter = make_text_splitter()
+    docs = []
+    resplit = 0
+    for source, stat in stats.items():
+        if previous is not None and previous.files.get(source) == stat:
+            docs.extend(previous.documents(source))
+        else:
+            docs.extend(split_source(files_dir, source, splitter))
+            resplit += 1
+
+    if dry_run:
+        tmp_dir = tempfile.mkdtemp(prefix="chunks-")
+        try:
+            result = sync_chunks(store, signature, ChunkStore.write(tmp_dir, docs, stats), manifest_path, dry_run)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    else:
+        result = sync_chunks(store, signature, ChunkStore.write(chunks_dir, docs, stats), manifest_path, dry_run)
+    result.resplit = resplit
+    return result
+
+
+def main():
+    from dotenv import load_dotenv
+    from embeddings import load_embedding_model, embedding_signature
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files-dir", default=FILES_DIR)
+    parser.add_argument("--dry-run", action="store_true", help="report changes without embedding anything")
+    args = parser.parse_args()
+
+    load_dotenv()
+    backend = os.getenv("EMBEDDING_BACKEND", "torch")
+    onnx_dir = os.getenv("ONNX_MODEL_DIR", os.path.join(BASE_DIR, "data/models", "multilingual-e5-large-onnx"))
+    store = None if args.dry_run else open_vector_store(load_embedding_model(backend, onnx_dir))
+    result = ingest(store, store_signature(embedding_signature(backend)), files_dir=args.files_dir, dry_run=args.dry_run)
+    print(("[dry run] " if args.dry_run else "") + result.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import os
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from bm25_index import BM25Index
+from chunk_store import ChunkStore
+from metrics import Gauge
+from retrieval import RAG_STAGE_SECONDS, HybridRetriever, chunk_id
+from vector_index import NumpyVectorStore
+from ingest import (
+    DB_DIR, CHROMA_DIR, CHROMA_MEMORY_LIMIT, VECTOR_STORE, make_text_splitter, open_vector_store, split_text, sync_chunks,
+)
+
+
+TENANT_KB_LOADED = Gauge("rag_tenant_kb_loaded", "Tenant knowledge bases currently loaded")
+TENANT_KB_BYTES = Gauge("rag_tenant_kb_bytes", "Estimated resident size of the loaded tenant knowledge bases")
+TENANT_KB_MAX_BYTES = Gauge("rag_tenant_kb_max_bytes", "Memory budget of the tenant knowledge bases (TENANT_KB_MEMORY_MB)")
+
+TENANTS_DIR = os.path.join(DB_DIR, "tenants")
+# multilingual-e5-large vectors are 1024 float32 values
+VECTOR_BYTES = 1024 * 4
+
+
+class PersistentBM25Retriever(BaseRetriever):
+    """BM25 retriever backed by the prebuilt on-disk index instead of rebuilding per query"""
+    index: Any
+    chunks: Any
+    k: int = 3
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        return [self.chunks.document(i) for i, _ in self.index.search(query, self.k)]
+
+
+class KnowledgeBase:
+    """One searchable corpus: its chunks, their BM25 index and their vector collection"""
+
+    def __init__(self, name: str, chunks: ChunkStore, store, bm25_dir: str, embeddings, executor,
+                 k: int = 6, first_stage_k: int = 20, weights=(0.6, 0.4), stage_timeout: float = 3.0, reranker=None):
+        self.name = name
+        self.chunks = chunks
+        self.store = store
+        self.k = k
+        self.reranker = reranker
+        if isinstance(store, NumpyVectorStore):
+            # It keeps only vectors and IDs, result texts come from the chunk store
+            store.chunks = chunks
+        # Lexical index is built once and memory-mapped, rebuilt only if the chunks changed
+        self.bm25_index = BM25Index.load_or_build(bm25_dir, chunks.texts(), expected=chunks.fingerprint)
+        self.bm25_retriever = PersistentBM25Retriever(index=self.bm25_index, chunks=chunks, k=first_stage_k)
+        # Vector and BM25 searches run concurrently off the event loop, each recalls
+        # first_stage_k candidates and the reranker picks the final k
+        self.hybrid = HybridRetriever(
+            embed_query=embeddings.aembed_query,
+            vector_search=lambda embedding: store.similarity_search_by_vector(embedding, k=first_stage_k),
+            lexical_search=self.bm25_retriever.invoke,
+            weights=weights,
+            executor=executor,
+            stage_timeout=stage_timeout,
+        )
+
+    @property
+    def version(self) -> str:
+        return self.bm25_index.fingerprint
+
+    def __len__(self):
+        return len(self.chunks)
+
+    @property
+    def nbytes(self) -> int:
+        """Rough resident size: chunk store, BM25 arrays and the collection's vectors (see TenantKnowledgeBases)"""
+        lexical = sum(getattr(self.bm25_index, name).nbytes for name in ("idf", "doc_len", "indptr", "postings", "term_freqs"))
+        return self.chunks.nbytes + lexical + len(self.chunks) * VECTOR_BYTES
+
+    async def aembed_query(self, query: str):
+        return await self.hybrid.aembed_query(query)
+
+    async def asearch(self, query: str, query_embedding=None) -> List[Document]:
+        candidates = await self.hybrid.asearch(query, query_embedding)
+        if self.reranker is None:
+            ranked = candidates[:self.k]
+        else:
+            started = time.perf_counter()
+            ranked = await self.reranker.rerank(query, query_embedding, candidates, self.store, self.k)
+            RAG_STAGE_SECONDS.labels("rerank").observe(time.perf_counter() - started)
+        # Prompt text comes from the chunk store by ID, whatever the vector store kept
+        return [self.chunks.document_by_id(chunk_id(doc)) or doc for doc in ranked]
+
+
+def load_context_rows(organization_id, department_id):
+    """
+    Context rows visible to a tenant: organization-wide rows plus its
+    department's rows. Without a department only organization-wide rows.
+    """
+    from sqlalchemy import or_
+    from database import SessionLocal
+    from models import Context
+
+    db = SessionLocal()
+    try:
+        query = db.query(Context.id, Context.content, Context.updated_at).filter(
+            Context.organization_id == organization_id
+        )
+        if department_id is None:
+            query = query.filter(Context.department_id.is_(None))
+        else:
+            query = query.filter(or_(Context.department_id == department_id, Context.department_id.is_(None)))
+        return query.order_by(Context.started_at, Context.id).all()
+    finally:
+        db.close()
+
+
+class _TenantEntry:
+    def __init__(self, kb: KnowledgeBase, rows_version: str):
+        self.kb = kb
+        self.rows_version = rows_version
+        self.checked_at = time.monotonic()
+
+
+class TenantKnowledgeBases:
+    """
+    Knowledge bases scoped to an organization (and optionally a department),
+    built from `Context` rows. Each tenant gets its own Chroma collection and
+    BM25 index on disk.
+
+    Loaded tenants live in an LRU bounded by an estimated memory budget, the
+    least recently used ones are dropped first. Rows are re-checked at most
+    every `refresh_seconds`, and only changed chunks get embedded again.
+
+    Dropping a tenant releases its chunk store, BM25 arrays and (with
+    VECTOR_STORE=numpy) its vectors once in-flight searches finish. Chroma
+    keeps collection segments loaded in its own client cache, which only
+    unloads them when CHROMA_MEMORY_LIMIT_MB is set; otherwise the budget
+    bounds just the chunks and BM25 arrays.
+    """
+
+    def __init__(self, embeddings, signature: str, executor, max_bytes: int, refresh_seconds: float = 60,
+                 load_rows: Callable = load_context_rows, tenants_dir: str = TENANTS_DIR, **kb_kwargs):
+        self.embeddings = embeddings
+        self.signature = signature
+        self.executor = executor
+        self.max_bytes = max_bytes
+        self.refresh_seconds = refresh_seconds
+        self.load_rows = load_rows
+        self.tenants_dir = tenants_dir
+        self.kb_kwargs = kb_kwargs
+        self._loaded = OrderedDict()
+        # Per-tenant load locks, only touched on the event loop
+        self._locks = {}
+        # Builds run in worker threads, the LRU is touched from both sides
+        self._mutex = threading.Lock()
+        TENANT_KB_LOADED.set_function(lambda: self.stats()["loaded"])
+        TENANT_KB_BYTES.set_function(lambda: self.stats()["bytes"])
+        TENANT_KB_MAX_BYTES.set(max_bytes)
+        if VECTOR_STORE == "chroma" and not CHROMA_MEMORY_LIMIT:
+            print("CHROMA_MEMORY_LIMIT_MB is not set, evicted tenants' Chroma segments stay in memory")
+
+    @staticmethod
+    def tenant_key(organization_id, department_id) -> str:
+        raw = f"{organization_id}:{department_id or '*'}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:24]
+
+    def _fresh(self, key: str) -> Optional[_TenantEntry]:
+        with self._mutex:
+            entry = self._loaded.get(key)
+            if entry is None:
+                return None
+            self._loaded.move_to_end(key)
+        if time.monotonic() - entry.checked_at < self.refresh_seconds:
+            return entry
+        return None
+
+    async def get(self, organization_id, department_id=None) -> KnowledgeBase:
+        key = self.tenant_key(organization_id, department_id)
+        entry = self._fresh(key)
+        if entry is not None:
+            return entry.kb
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # Another request may have loaded it while we waited
+            entry = self._fresh(key)
+            if entry is None:
+                loop = asyncio.get_running_loop()
+                entry = await loop.run_in_executor(self.executor, self._load, key, organization_id, department_id)
+        self._prune_locks()
+        return entry.kb
+
+    def _prune_locks(self):
+        """Drop the locks of evicted tenants, unless a load is waiting on them"""
+        with self._mutex:
+            loaded = set(self._loaded)
+        for key in [key for key, lock in self._locks.items() if key not in loaded and not lock.locked()]:
+            del self._locks[key]
+
+    def _load(self, key: str, organization_id, department_id) -> _TenantEntry:
+        rows = self.load_rows(organization_id, department_id)
+        digest = hashlib.sha256()
+        for row in rows:
+            digest.update(f"{row.id}:{row.updated_at}\n".encode("utf-8"))
+        rows_version = digest.hexdigest()
+
+        with self._mutex:
+            entry = self._loaded.get(key)
+        if entry is not None and entry.rows_version == rows_version:
+            entry.checked_at = time.monotonic()
+            return entry
+
+        tenant_dir = os.path.join(self.tenants_dir, key)
+        splitter = make_text_splitter()
+        docs = []
+        for row in rows:
+            if row.content:
+                docs.extend(split_text(row.content, f"context/{row.id}", splitter))
+
+        chunks = ChunkStore.write(os.path.join(tenant_dir, "chunks"), docs)
+        store = open_vector_store(self.embeddings, CHROMA_DIR, collection_name=f"tenant_{key}")
+        result = sync_chunks(store, self.signature, chunks, os.path.join(tenant_dir, "manifest.json"))
+        print(f"Tenant {organization_id}/{department_id or '*'}: {result.summary()}")
+
+        kb = KnowledgeBase(
+            f"tenant:{key}", chunks, store, os.path.join(tenant_dir, "bm25_index"),
+            self.embeddings, self.executor, **self.kb_kwargs
+        )
+        entry = _TenantEntry(kb, rows_version)
+        with self._mutex:
+            self._loaded[key] = entry
+            self._loaded.move_to_end(key)
+            self._evict()
+        return entry
+
+    def _evict(self):
+        total = sum(entry.kb.nbytes for entry in self._loaded.values())
+        # Always keep the tenant that was just loaded
+        while total > self.max_bytes and len(self._loaded) > 1:
+            key, entry = self._loaded.popitem(last=False)
+            total -= entry.kb.nbytes
+            print(f"Evicted tenant knowledge base {key} ({entry.kb.nbytes} bytes)")
+
+    def stats(self) -> dict:
+        with self._mutex:
+            return {
+                "loaded": len(self._loaded),
+                "bytes": sum(entry.kb.nbytes for entry in self._loaded.values()),
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from typing import List, Optional
+
+from openai import AsyncOpenAI
+
+from llm_governor import GOVERNOR, LLM_BASE_URL, LLM_MODEL, LLM_TTFT, llm_api_key, record_usage
+from metrics import Counter, Gauge, Histogram
+
+
+BACKEND_TTFT = Histogram(
+    "rag_llm_backend_ttft_seconds", "Time to first content token per backend (winning streams only)",
+    labelnames=("backend",), buckets=(0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0),
+)
+BACKEND_ERRORS = Counter("rag_llm_backend_errors_total", "Failed stream openings per backend", labelnames=("backend",))
+LLM_STREAM_SECONDS = Histogram(
+    "rag_llm_stream_seconds", "Total time of a completed completion stream",
+    labelnames=("prompt",), buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0),
+)
+LLM_TOKENS_PER_SECOND = Histogram(
+    "rag_llm_tokens_per_second", "Content chunks per second after the first token",
+    labelnames=("prompt",), buckets=(5, 10, 20, 30, 40, 60, 80, 120, 200),
+)
+BACKEND_TTFT_EWMA = Gauge("rag_llm_backend_ttft_ewma_seconds", "Running TTFT estimate that orders the backends", labelnames=("backend",))
+BACKEND_ERROR_RATE = Gauge("rag_llm_backend_error_rate", "Running error-rate estimate per backend", labelnames=("backend",))
+BACKEND_SCORE = Gauge("rag_llm_backend_score", "Expected cost of trying a backend first, lowest goes first", labelnames=("backend",))
+HEDGES = Counter(
+    "rag_llm_hedges_total", "Hedged requests (fired) and which attempt produced the answer (primary, hedge)",
+    labelnames=("outcome",),
+)
+
+
+class Backend:
+    """
+    One OpenAI-compatible endpoint plus running stats: an EWMA of time to
+    first token and of the error rate. A cancelled attempt (lost a hedge, or
+    the client went away) only shows its TTFT is at least the time it ran,
+    so it can raise the estimate but never lower it.
+    """
+
+    def __init__(self, name: str, base_url: str, model: str, api_key: Optional[str] = None,
+                 alpha: float = 0.2, prior_ttft: float = 1.0):
+        self.name = name
+        self.model = model
+        self.client = AsyncOpenAI(api_key=api_key or "unused", base_url=base_url, max_retries=0)
+        self.alpha = alpha
+        self.ttft = prior_ttft
+        self.error_rate = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, ttft: Optional[float] = None, error: bool = False):
+        with self._lock:
+            self.error_rate += self.alpha * ((1.0 if error else 0.0) - self.error_rate)
+            if ttft is not None:
+                self.ttft += self.alpha * (ttft - self.ttft)
+
+    def observe_cancelled(self, elapsed: float):
+        with self._lock:
+            if elapsed > self.ttft:
+                self.ttft += self.alpha * (elapsed - self.ttft)
+
+    @property
+    def score(self) -> float:
+        """Expected cost of trying this backend first, lower is better"""
+        return self.ttft * (1 + 4 * self.error_rate)
+
+
+def backends_from_env() -> List[Backend]:
+    """
+    LLM_BACKENDS is a JSON list of {"name", "base_url", "model", "api_key_env"};
+    without it the single LLM_BASE_URL/LLM_MODEL backend is used.
+    """
+    raw = os.getenv("LLM_BACKENDS")
+    if not raw:
+        return [Backend("default", LLM_BASE_URL, LLM_MODEL, llm_api_key())]
+    backends = []
+    for i, spec in enumerate(json.loads(raw)):
+        backends.append(Backend(
+            spec.get("name", f"backend{i}"),
+            spec["base_url"],
+            spec.get("model", LLM_MODEL),
+            os.getenv(spec.get("api_key_env", "DEEPSEEK_API_KEY")),
+        ))
+    return backends
+
+
+class _Opened:
+    """A stream whose first content chunk has arrived"""
+
+    def __init__(self, response, iterator, buffered, ttft):
+        self.response = response
+        self.iterator = iterator
+        self.buffered = buffered
+        self.ttft = ttft
+
+
+class BackendPool:
+    """
+    Streams a completion from the best backend, hedging slow ones.
+
+    Backends are tried in order of their stats. If the first one hasn't sent
+    a content token within `hedge_after` seconds (or fails), the next one is
+    started too; the first stream to produce a token wins and every other
+    attempt is cancelled and closed. The whole race holds a single governor
+    slot, so hedging adds at most len(backends) - 1 extra provider calls per
+    request and never more concurrent requests.
+    """
+
+    def __init__(self, backends: List[Backend], governor=GOVERNOR, hedge_after: float = 1.5):
+        if not backends:
+            raise ValueError("At least one LLM backend is required")
+        self.backends = backends
+        self.governor = governor
+        self.hedge_after = hedge_after
+        for backend in backends:
+            BACKEND_TTFT_EWMA.labels(backend.name).set_function(lambda backend=backend: backend.ttft)
+            BACKEND_ERROR_RATE.labels(backend.name).set_function(lambda backend=backend: backend.error_rate)
+            BACKEND_SCORE.labels(backend.name).set_function(lambda backend=backend: backend.score)
+
+    @classmethod
+    def from_env(cls, governor=GOVERNOR) -> "BackendPool":
+        return cls(backends_from_env(), governor, hedge_after=float(os.getenv("LLM_HEDGE_AFTER_MS", "1500")) / 1000)
+
+    def ordered(self) -> List[Backend]:
+        # Stable sort keeps the configured order between equally good backends
+        return sorted(self.backends, key=lambda backend: backend.score)
+
+    async def _open(self, backend: Backend, kwargs) -> _Opened:
+        started = time.monotonic()
+        response = await self.governor.acreate(backend.client, model=backend.model, **kwargs)
+        iterator = response.__aiter__()
+        buffered = []
+        try:
+            while True:
+                try:
+                    chunk = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+                buffered.append(chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    break
+        except BaseException:
+            await response.close()
+            raise
+        return _Opened(response, iterator, buffered, time.monotonic() - started)
+
+    async def _race(self, kwargs):
+        order = self.ordered()
+        attempts = {}
+        started_at = {}
+        launched = 0
+        last_error = None
+
+        def launch():
+            nonlocal launched
+            backend = order[launched]
+            task = asyncio.create_task(self._open(backend, kwargs))
+            attempts[task] = backend
+            started_at[task] = time.monotonic()
+            launched += 1
+
+        launch()
+        try:
+            while True:
+                timeout = self.hedge_after if launched < len(order) else None
+                done, _ = await asyncio.wait(attempts, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    HEDGES.labels("fired").inc()
+                    launch()
+                    continue
+                winner = None
+                for task in done:
+                    backend = attempts.pop(task)
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        backend.observe(error=True)
+                        BACKEND_ERRORS.labels(backend.name).inc()
+                        print(f"LLM backend {backend.name} failed: {last_error}")
+                    elif winner is None:
+                        winner = (backend, task.result())
+                    else:
+                        await task.result().response.close()
+                if winner is not None:
+                    backend, opened = winner
+                    backend.observe(ttft=opened.ttft)
+                    BACKEND_TTFT.labels(backend.name).observe(opened.ttft)
+                    if launched > 1:
+                        HEDGES.labels("primary" if backend is order[0] else "hedge").inc()
+                    return backend, opened
+                if not attempts:
+                    # Everything launched so far failed: fail over right away
+                    if launched < len(order):
+                        launch()
+                    else:
+                        raise last_error
+        finally:
+            for task, backend in attempts.items():
+                task.cancel()
+                backend.observe_cancelled(time.monotonic() - started_at[task])
+            results = await asyncio.gather(*attempts, return_exceptions=True)
+            for opened in results:
+                # Finished just before it was cancelled
+                if isinstance(opened, _Opened):
+                    await opened.response.close()
+
+    async def astream(self, user=None, label: str = "chat", **kwargs):
+        """Streamed completion chunks from the winning backend, holding one governor slot"""
+        async with self.governor.slot(user):
+            started = time.monotonic()
+            backend, opened = await self._race(kwargs)
+            first_token_at = time.monotonic()
+            LLM_TTFT.labels(label).observe(first_token_at - started)
+            content_chunks = 0
+            try:
+                for chunk in opened.buffered:
+                    record_usage(label, getattr(chunk, "usage", None))
+                    yield chunk
+                while True:
+                    try:
+                        chunk = await opened.iterator.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        content_chunks += 1
+                    record_usage(label, getattr(chunk, "usage", None))
+                    yield chunk
+                finished = time.monotonic()
+                LLM_STREAM_SECONDS.labels(label).observe(finished - started)
+                if content_chunks and finished > first_token_at:
+                    LLM_TOKENS_PER_SECOND.labels(label).observe(content_chunks / (finished - first_token_at))
+            finally:
+                # Also runs when the client disconnects and the stream is cancelled
+                await opened.response.close()
@@ -0,0 +1,267 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+
+import openai
+
+from metrics import Counter, Gauge, Histogram
+
+
+# Any OpenAI-compatible endpoint, e.g. fake_llm.py for offline load tests
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://api.deepseek.com")
+LLM_MODEL = os.getenv("LLM_MODEL", "deepseek-chat")
+
+
+def llm_api_key():
+    # A local stand-in doesn't check keys, the client just refuses to start without one
+    return os.getenv("DEEPSEEK_API_KEY") or ("unused" if "api.deepseek.com" not in LLM_BASE_URL else None)
+
+
+LLM_IN_FLIGHT = Gauge("rag_llm_in_flight", "Completion calls currently holding a slot")
+LLM_QUEUE_DEPTH = Gauge("rag_llm_queue_depth", "Completion calls waiting for a slot")
+LLM_QUEUE_WAIT = Histogram(
+    "rag_llm_queue_wait_seconds", "Time a completion call waited for a slot",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+LLM_REJECTED = Counter("rag_llm_rejected_total", "Completion calls rejected by admission control", labelnames=("reason",))
+LLM_RETRIES = Counter("rag_llm_retries_total", "Completion calls retried after a provider error", labelnames=("status",))
+LLM_PROMPT_TOKENS = Counter(
+    "rag_llm_prompt_tokens_total", "Prompt tokens by prompt and provider prefix-cache outcome (hit, miss)",
+    labelnames=("prompt", "cache"),
+)
+LLM_COMPLETION_TOKENS = Counter("rag_llm_completion_tokens_total", "Completion tokens generated", labelnames=("prompt",))
+LLM_TTFT = Histogram(
+    "rag_llm_ttft_seconds", "Time from sending a completion request to its first content token",
+    labelnames=("prompt",), buckets=(0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0),
+)
+
+
+def record_usage(label: str, usage):
+    """Count prompt tokens served from the provider's prefix cache vs computed fresh"""
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    # DeepSeek reports prompt_cache_hit_tokens, OpenAI-style APIs prompt_tokens_details.cached_tokens
+    hit = getattr(usage, "prompt_cache_hit_tokens", None)
+    if hit is None:
+        hit = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None) or 0
+    miss = getattr(usage, "prompt_cache_miss_tokens", None)
+    if miss is None:
+        miss = max(prompt_tokens - hit, 0)
+    LLM_PROMPT_TOKENS.labels(label, "hit").inc(hit)
+    LLM_PROMPT_TOKENS.labels(label, "miss").inc(miss)
+    LLM_COMPLETION_TOKENS.labels(label).inc(getattr(usage, "completion_tokens", 0) or 0)
+
+
+class LLMBusy(Exception):
+    """No completion slot available, surfaced to clients as 429"""
+    status_code = 429
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _retry_status(error: Exception) -> Optional[str]:
+    """Label for errors worth retrying (throttling, 5xx, connection problems), None otherwise"""
+    if isinstance(error, openai.APIStatusError):
+        if error.status_code == 429 or error.status_code >= 500:
+            return str(error.status_code)
+        return None
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return "connection"
+    return None
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+class _Waiter:
+    __slots__ = ("user", "granted", "wake")
+
+    def __init__(self, user, wake):
+        self.user = user
+        self.granted = False
+        self.wake = wake
+
+
+class LLMGovernor:
+    """
+    Admission control in front of every completion call.
+
+    At most `max_in_flight` calls run at once, and at most `max_per_user`
+    for one user. Further calls wait in a FIFO queue of `max_queue` entries;
+    a full queue or a wait longer than `queue_timeout` raises LLMBusy. A
+    freed slot is handed straight to the first waiter that may use it.
+
+    Slots are shared by async callers (the API) and sync callers (the TTS
+    normalizer), so the state lives behind a threading lock. Calls that fail
+    with 429/5xx before producing anything are retried with jittered
+    exponential backoff.
+    """
+
+    def __init__(self, max_in_flight: int = 8, max_per_user: int = 2, max_queue: int = 32,
+                 queue_timeout: float = 30.0, max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 8.0):
+        self.max_in_flight = max_in_flight
+        self.max_per_user = max_per_user
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._per_user = {}
+        self._waiters = deque()
+
+    @classmethod
+    def from_env(cls) -> "LLMGovernor":
+        return cls(
+            max_in_flight=int(os.getenv("LLM_MAX_IN_FLIGHT", "8")),
+            max_per_user=int(os.getenv("LLM_MAX_PER_USER", "2")),
+            max_queue=int(os.getenv("LLM_MAX_QUEUE", "32")),
+            queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "30")),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+            backoff_base=float(os.getenv("LLM_BACKOFF_BASE", "0.5")),
+            backoff_max=float(os.getenv("LLM_BACKOFF_MAX", "8")),
+        )
+
+    def _can_run(self, user) -> bool:
+        return self._in_flight < self.max_in_flight and self._per_user.get(user, 0) < self.max_per_user
+
+    def _grant(self, user):
+        self._in_flight += 1
+        self._per_user[user] = self._per_user.get(user, 0) + 1
+        LLM_IN_FLIGHT.set(self._in_flight)
+
+    def _enqueue(self, user, wake) -> Optional[_Waiter]:
+        """Take a slot now (returns None) or join the queue (returns the waiter)"""
+        with self._lock:
+            if self._can_run(user):
+                self._grant(user)
+                return None
+            if len(self._waiters) >= self.max_queue:
+                LLM_REJECTED.labels("queue_full").inc()
+                raise LLMBusy("Too many requests are waiting for the language model")
+            waiter = _Waiter(user, wake)
+            self._waiters.append(waiter)
+            LLM_QUEUE_DEPTH.set(len(self._waiters))
+            return waiter
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Leave the queue after a timeout; False if a slot was granted meanwhile"""
+        with self._lock:
+            if waiter.granted:
+                return False
+            self._waiters.remove(waiter)
+            LLM_QUEUE_DEPTH.set(len(self._waiters))
+        LLM_REJECTED.labels("timeout").inc()
+        return True
+
+    def _release(self, user):
+        with self._lock:
+            self._in_flight -= 1
+            self._per_user[user] -= 1
+            if not self._per_user[user]:
+                del self._per_user[user]
+            for waiter in list(self._waiters):
+                if self._in_flight >= self.max_in_flight:
+                    break
+                if self._can_run(waiter.user):
+                    self._waiters.remove(waiter)
+                    self._grant(waiter.user)
+                    waiter.granted = True
+                    waiter.wake()
+            LLM_QUEUE_DEPTH.set(len(self._waiters))
+            LLM_IN_FLIGHT.set(self._in_flight)
+
+    def check_admission(self, user=None):
+        """Fail fast before a response starts streaming if the call would be rejected anyway"""
+        with self._lock:
+            if not self._can_run(user) and len(self._waiters) >= self.max_queue:
+                LLM_REJECTED.labels("queue_full").inc()
+                raise LLMBusy("Too many requests are waiting for the language model")
+
+    @asynccontextmanager
+    async def slot(self, user=None):
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(True))
+
+        started = time.monotonic()
+        waiter = self._enqueue(user, wake)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(granted), self.queue_timeout)
+            except asyncio.TimeoutError:
+                if self._abandon(waiter):
+                    raise LLMBusy("Timed out waiting for the language model", retry_after=self.queue_timeout / 4)
+            except asyncio.CancelledError:
+                if not self._abandon(waiter):
+                    self._release(user)
+                raise
+        LLM_QUEUE_WAIT.observe(time.monotonic() - started)
+        try:
+            yield
+        finally:
+            self._release(user)
+
+    @contextmanager
+    def slot_sync(self, user=None):
+        granted = threading.Event()
+        started = time.monotonic()
+        waiter = self._enqueue(user, granted.set)
+        if waiter is not None and not granted.wait(self.queue_timeout) and self._abandon(waiter):
+            raise LLMBusy("Timed out waiting for the language model", retry_after=self.queue_timeout / 4)
+        LLM_QUEUE_WAIT.observe(time.monotonic() - started)
+        try:
+            yield
+        finally:
+            self._release(user)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        # Full jitter, but never sooner than the provider asked for
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return max(delay, _retry_after(error) or 0.0)
+
+    async def acreate(self, client, **kwargs):
+        """client.chat.completions.create with retries, call inside a slot"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await client.chat.completions.create(**kwargs)
+            except Exception as e:
+                status = _retry_status(e)
+                if status is None or attempt == self.max_retries:
+                    raise
+                LLM_RETRIES.labels(status).inc()
+                await asyncio.sleep(self._backoff(attempt, e))
+
+    def create(self, client, label: str = "chat", **kwargs):
+        """Sync counterpart of acreate for non-streamed completions"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = client.chat.completions.create(**kwargs)
+                record_usage(label, getattr(response, "usage", None))
+                return response
+            except Exception as e:
+                status = _retry_status(e)
+                if status is None or attempt == self.max_retries:
+                    raise
+                LLM_RETRIES.labels(status).inc()
+                time.sleep(self._backoff(attempt, e))
+
+
+# One governor per process, shared by the RAG pipeline and the normalizer
+GOVERNOR = LLMGovernor.from_env()
@@ -0,0 +1,234 @@
+"""
+Open-loop load generator for the API.
+
+Logs in --users accounts with email/password, creates a chat session for
+each, then fires requests at a fixed rate (independent of how fast
+responses come back) across /message/send, /complain/answer, /session/list
+and /message/list, each one as a randomly picked user. Writes a JSON report
+with per-endpoint p50/p95/p99 latency, time to first SSE data frame for
+streamed endpoints, status codes and error rates.
+
+The LLM governor admits only LLM_MAX_PER_USER concurrent calls per user,
+so use enough users for the target rate, or the run mostly measures 429s.
+--email takes an {i} placeholder for the user number; --create-users adds
+missing accounts straight to URL_DATABASE first.
+
+    python fake_llm.py --ttft 0.4 --tps 40 &
+    LLM_BASE_URL=http://localhost:8090 uvicorn main:app --port 8000 &
+    python loadtest.py --base-url http://localhost:8000 --email 'load-{i}@example.com' --password secret \\
+        --users 50 --create-users --rps 20 --duration 60 --out loadtest.json
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+
+import httpx
+import numpy as np
+
+
+QUESTIONS = [
+    "Иргэний үнэмлэхний лавлагаа хаанаас авах вэ?",
+    "Оршин суугаа газрын тодорхойлолт авахад юу хэрэгтэй вэ?",
+    "Төрсний гэрчилгээгээ гээсэн бол яах вэ?",
+    "Даланзадгад сумын засаг дарга хэн бэ?",
+]
+
+# Relative share of traffic per endpoint, overridable with --mix
+DEFAULT_MIX = {"message_send": 4, "complain_answer": 1, "session_list": 3, "message_list": 2}
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies = []
+        self.ttfts = []
+        self.statuses = {}
+        self.errors = 0
+        self.requests = 0
+
+    def record(self, status, latency, ttft=None, failed=False):
+        self.requests += 1
+        self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+        if failed:
+            self.errors += 1
+        else:
+            self.latencies.append(latency)
+            if ttft is not None:
+                self.ttfts.append(ttft)
+
+    @staticmethod
+    def _percentiles(values):
+        if not values:
+            return None
+        ms = np.asarray(values) * 1000
+        return {p: round(float(np.percentile(ms, int(p[1:]))), 1) for p in ("p50", "p95", "p99")}
+
+    def report(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": round(self.errors / self.requests, 4) if self.requests else 0.0,
+            "status_codes": self.statuses,
+            "latency_ms": self._percentiles(self.latencies),
+            "ttft_ms": self._percentiles(self.ttfts),
+        }
+
+
+def create_users(emails, password: str):
+    """Add the accounts that don't exist yet, directly in the database"""
+    import uuid
+    from passlib.context import CryptContext
+    from database import SessionLocal
+    from models import User
+
+    db = SessionLocal()
+    try:
+        existing = {email for email, in db.query(User.email).filter(User.email.in_(emails))}
+        hashed = CryptContext(schemes=["bcrypt"], deprecated="auto").hash(password)
+        for email in emails:
+            if email not in existing:
+                db.add(User(id=uuid.uuid4(), email=email, name=email.split("@")[0], password=hashed))
+        db.commit()
+        print(f"Created {len(emails) - len(existing)} load test users", file=sys.stderr)
+    finally:
+        db.close()
+
+
+async def login(client: httpx.AsyncClient, email: str, password: str) -> str:
+    response = await client.post("/auth/email", json={"username": email, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def start_user(client: httpx.AsyncClient, email: str, password: str):
+    """Auth headers and a fresh chat session for one user"""
+    headers = {"Authorization": f"Bearer {await login(client, email, password)}"}
+    response = await client.post("/session/create", json={"message": "loadtest"}, headers=headers)
+    response.raise_for_status()
+    return headers, response.json()
+
+
+async def stream_request(client, path, payload, headers, stats: EndpointStats):
+    started = time.perf_counter()
+    ttft = None
+    failed = False
+    try:
+        async with client.stream("POST", path, json=payload, headers=headers) as response:
+            if response.status_code != 200:
+                await response.aread()
+                stats.record(response.status_code, time.perf_counter() - started, failed=True)
+                return
+            async for line in response.aiter_lines():
+                if line.startswith("data:") and ttft is None:
+                    ttft = time.perf_counter() - started
+                elif line.startswith("event: error"):
+                    failed = True
+            stats.record(response.status_code, time.perf_counter() - started, ttft, failed or ttft is None)
+    except httpx.HTTPError as e:
+        stats.record(type(e).__name__, time.perf_counter() - started, failed=True)
+
+
+async def plain_request(client, method, path, headers, stats: EndpointStats):
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, path, headers=headers)
+        stats.record(response.status_code, time.perf_counter() - started, failed=response.status_code >= 400)
+    except httpx.HTTPError as e:
+        stats.record(type(e).__name__, time.perf_counter() - started, failed=True)
+
+
+async def run(args) -> dict:
+    mix = dict(DEFAULT_MIX)
+    for item in args.mix or []:
+        name, weight = item.split("=")
+        mix[name] = float(weight)
+    names = [name for name, weight in mix.items() if weight > 0]
+    weights = [mix[name] for name in names]
+
+    emails = [args.email.format(i=i) for i in range(1, args.users + 1)]
+    if len(set(emails)) != len(emails):
+        sys.exit("--users above 1 needs an {i} placeholder in --email")
+    if args.create_users:
+        create_users(emails, args.password)
+
+    limits = httpx.Limits(max_connections=args.max_outstanding, max_keepalive_connections=args.max_outstanding)
+    timeout = httpx.Timeout(args.timeout, connect=10)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=timeout) as client:
+        users = await asyncio.gather(*(start_user(client, email, args.password) for email in emails))
+
+        stats = {name: EndpointStats() for name in names}
+        dropped = 0
+
+        def request(name):
+            question = random.choice(QUESTIONS)
+            headers, session_id = random.choice(users)
+            if name == "message_send":
+                return stream_request(client, "/message/send", {"session_id": session_id, "text": question}, headers, stats[name])
+            if name == "complain_answer":
+                return stream_request(client, "/complain/answer", {"query": question}, headers, stats[name])
+            if name == "session_list":
+                return plain_request(client, "POST", "/session/list", headers, stats[name])
+            return plain_request(client, "GET", f"/message/list/{session_id}", headers, stats[name])
+
+        tasks = set()
+        interval = 1 / args.rps
+        started = time.perf_counter()
+        sent = 0
+        # Open loop: request n goes out at started + n * interval whatever happened before it
+        while time.perf_counter() - started < args.duration:
+            if len(tasks) >= args.max_outstanding:
+                dropped += 1
+            else:
+                task = asyncio.create_task(request(random.choices(names, weights)[0]))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            sent += 1
+            await asyncio.sleep(max(0.0, started + sent * interval - time.perf_counter()))
+        elapsed = time.perf_counter() - started
+        if tasks:
+            await asyncio.wait(tasks, timeout=args.timeout)
+
+    completed = sum(s.requests for s in stats.values())
+    errors = sum(s.errors for s in stats.values())
+    return {
+        "target_rps": args.rps,
+        "users": len(users),
+        "achieved_rps": round(completed / elapsed, 2),
+        "duration_seconds": round(elapsed, 1),
+        "requests": completed,
+        "errors": errors,
+        "error_rate": round(errors / completed, 4) if completed else 0.0,
+        # Requests not sent because max_outstanding were already in flight
+        "dropped": dropped,
+        "endpoints": {name: s.report() for name, s in stats.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--email", required=True, help="login email, {i} is replaced by the user number (1..--users)")
+    parser.add_argument("--password", required=True, help="shared by all load test users")
+    parser.add_argument("--users", type=int, default=1, help="users (each with its own session) to spread requests over")
+    parser.add_argument("--create-users", action="store_true", help="create missing users in URL_DATABASE first")
+    parser.add_argument("--rps", type=float, default=10)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--max-outstanding", type=int, default=256)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--mix", nargs="*", help="endpoint=weight, e.g. message_send=5 session_list=0")
+    parser.add_argument("--out", default=None, help="write the JSON report here as well as stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+    sys.exit(0 if report["requests"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,28 +2,58 @@ from openai import OpenAI
 from datetime import datetime, timedelta
 import os
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi import FastAPI, HTTPException, Depends, status, Path
-from database import engine, SessionLocal
-from sqlalchemy.orm import Session, aliased
-from sqlalchemy import func, and_
+from fastapi import FastAPI, HTTPException, Depends, status, Path, Query, Request
+from database import AsyncSessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from typing import Annotated
-from models import Session as SessionModel, User, Message as MessageModel, Base, SessionType
+from models import Session as SessionModel, User, Message as MessageModel, SessionType, ComplaintStatus
 from schema import QueryRequest, complainAnswer, GoogleAuth, Token, RefreshTokenRequest, Session, Message as MessageSchema, MessageCreate, sessionCreate, LoginRequest, Complain
 from fastapi.security import OAuth2PasswordBearer
+import asyncio
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from google.oauth2 import id_token
 from google.auth.transport import requests as grequests
-from typing import List
+from typing import List, Optional
 from uuid import UUID
 from dotenv import load_dotenv
 from rag import Rag
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from contextlib import asynccontextmanager
+from streaming import json_stream_response, sse_response
+from llm_governor import LLMBusy
+from metrics import render as render_metrics
+from inbox import open_complaint
+from queries import LIST_MAX_PAGE_SIZE, LIST_PAGE_SIZE, complaint_inbox, encode_cursor, search_messages, session_messages, user_sessions
+from message_events import message_event, persist_answer, publish_messages
+from observability import MetricsMiddleware
 
 load_dotenv()
 
-app = FastAPI()
+DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
+SECRET_KEY = os.getenv("SECRET_KEY")
+ALGORITHM = os.getenv("ALGORITHM")
+GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
+ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = 30
+# How long a RAG route waits on a cold start before answering 503
+RAG_WARMUP_WAIT = float(os.getenv("RAG_WARMUP_WAIT", "20"))
+# Rows fetched per round trip when a listing is streamed
+LIST_STREAM_BATCH = int(os.getenv("LIST_STREAM_BATCH", "500"))
+RAG = Rag()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load chunks, the embedding model and the vector store without blocking startup
+    RAG.start_warmup()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 origins = ["http://localhost:5173"]
 
 app.add_middleware(
@@ -32,28 +62,20 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Keyset-paginated listings hand out the next page's cursor in a header
+    expose_headers=["X-Next-Cursor"],
 )
+# Outermost, so it times everything including CORS handling
+app.add_middleware(MetricsMiddleware)
 
-Base.metadata.create_all(bind=engine)
+# The schema is managed by Alembic: `alembic upgrade head` runs before the app starts (compose, fly release)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
-DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
-SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = os.getenv("ALGORITHM")
-GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
-REFRESH_TOKEN_EXPIRE_DAYS = 30
-RAG = Rag()
-RAG.setup()
-
-db_dependency = Annotated[Session, Depends(get_db)]
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -65,14 +87,15 @@ def verify_password(plain_password: str, hashed_password: str):
 def get_password_hash(password: str):
     return pwd_context.hash(password)
 
-def get_user(db: Session, email: str):
-    return db.query(User).filter(User.email == email).first()
+async def get_user(db: AsyncSession, email: str):
+    return await db.scalar(select(User).where(User.email == email).limit(1))
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = get_user(db, email)
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    user = await get_user(db, email)
     if not user:
         return False
-    if not verify_password(password, user.password):
+    # bcrypt is deliberately slow, keep it off the event loop
+    if not await asyncio.to_thread(verify_password, password, user.password):
         return False
     return user
 
@@ -109,15 +132,64 @@ async def get_current_user(db: db_dependency, token: str = Depends(oauth2_scheme
     except JWTError:
         raise credentials_exception
     print(email)
-    user = db.query(User).filter(User.email == email).first()
+    user = await get_user(db, email)
     print(user)
     if user is None:
         raise credentials_exception
     return user
 
+async def rag_ready():
+    if not await RAG.wait_ready(RAG_WARMUP_WAIT):
+        if RAG.status == "failed":
+            error = RAG.warmup_error
+            RAG.start_warmup()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"Knowledge base failed to load: {error}",
+                headers={"Retry-After": str(round(RAG.warmup_retry_seconds))},
+            )
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Knowledge base is still loading, please retry shortly",
+            headers={"Retry-After": "5"},
+        )
+
+
+@app.exception_handler(LLMBusy)
+async def llm_busy_handler(request: Request, exc: LLMBusy):
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, round(exc.retry_after)))},
+    )
+
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/readyz")
+async def readyz():
+    rag_status = RAG.status
+    if rag_status == "failed":
+        error = RAG.warmup_error
+        # Probes keep hitting this endpoint, so they also drive the retries
+        RAG.start_warmup()
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"status": rag_status, "error": error})
+    if rag_status != "ready":
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"status": rag_status})
+    return {"status": rag_status}
+
+
 @app.post("/auth/email", response_model=Token)
 async def email_auth(db: db_dependency, form_data: LoginRequest):
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -171,7 +243,7 @@ async def google_auth(googleAuth: GoogleAuth, db: db_dependency):
         print(user_email)
         print(db)
         try:
-            user = get_or_create_user(
+            user = await get_or_create_user(
                 {'email': user_email, 'name': name},
                 db
             )
@@ -239,43 +311,17 @@ async def refresh_token(request: RefreshTokenRequest):
         )
 
 @app.post("/complain/list", response_model=List[Complain])
-async def complainList(db: db_dependency, current_user: User = Depends(get_current_user)):
+async def complainList(
+    db: db_dependency,
+    current_user: User = Depends(get_current_user),
+    limit: int = Query(50, ge=1, le=500),
+    since: Optional[datetime] = Query(None, description="Sessions started at or after, defaults to COMPLAIN_LIST_DAYS ago"),
+    until: Optional[datetime] = Query(None, description="Sessions started before"),
+    complaint_status: Optional[ComplaintStatus] = Query(None, alias="status"),
+):
     try:
-        first_message_subquery = (
-            db.query(
-                MessageModel.session_id,
-                func.min(MessageModel.timestamp).label("min_timestamp")
-            )
-            .join(Session, MessageModel.session_id == Session.id)
-            .filter(Session.type == SessionType.COMPLAIN)
-            .group_by(MessageModel.session_id)
-            .subquery()
-        )
-
-        # Alias for joining message again
-        MessageAlias = aliased(MessageModel)
-
-        # Final query to get details of the first message per session
-        results = (
-            db.query(
-                MessageAlias.id,
-                MessageAlias.session_id,
-                User.email,
-                User.name,
-                MessageAlias.text,
-            )
-            .join(Session, MessageAlias.session_id == Session.id)
-            .join(User, Session.user_id == User.id)
-            .join(
-                first_message_subquery,
-                and_(
-                    MessageAlias.session_id == first_message_subquery.c.session_id,
-                    MessageAlias.timestamp == first_message_subquery.c.min_timestamp
-                )
-            )
-            .all()
-        )
-        return results
+        results = await db.execute(complaint_inbox(since=since, until=until, limit=limit, status=complaint_status))
+        return results.all()
     
     except Exception as e:
         print(e)
@@ -283,12 +329,11 @@ async def complainList(db: db_dependency, current_user: User = Depends(get_curre
 
 
 @app.post("/complain/answer")
-async def generateAsnwer(request: QueryRequest, _: User = Depends(get_current_user)):
+async def generateAsnwer(request: QueryRequest, http_request: Request, current_user: User = Depends(get_current_user)):
+    # Reject with 429 before streaming starts if the LLM queue is already full
+    RAG.governor.check_admission(current_user.id)
     try:
-        return StreamingResponse(
-            RAG.generate(query=request.query),
-            media_type="text/event-stream",
-        )
+        return sse_response(RAG.generate(query=request.query, user_id=current_user.id), http_request)
     except Exception as e:
         print(f"error from send{e}")
         raise HTTPException(
@@ -296,57 +341,140 @@ async def generateAsnwer(request: QueryRequest, _: User = Depends(get_current_us
             detail="Failed to create message"
         )
 
+def page_response(items: list, rows: list, limit: int, position: str) -> JSONResponse:
+    """One page of a keyset-paginated listing, X-Next-Cursor is set when more rows exist"""
+    headers = {}
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        # Ranked listings (search) continue after the rank as well
+        headers["X-Next-Cursor"] = encode_cursor(getattr(last, position), last.id, getattr(last, "rank", None))
+    return JSONResponse(jsonable_encoder(items[:limit]), headers=headers)
+
+
+async def stream_scalars(statement, encode):
+    """Rows of `statement` from a server-side cursor, on a session owned by the response"""
+    async with AsyncSessionLocal() as db:
+        result = await db.stream_scalars(statement.execution_options(yield_per=LIST_STREAM_BATCH))
+        async for row in result:
+            yield encode(row)
+
+
+def session_item(session: SessionModel) -> dict:
+    return {"id": session.id, "user_id": session.user_id, "title": session.title, "started_at": session.started_at}
+
+
+def message_item(message: MessageModel) -> dict:
+    return {"user": message.text} if message.is_from_user else {"system": message.text}
+
+
 @app.post("/session/list", response_model=List[Session])
-async def sessionList(db: db_dependency, current_user: User = Depends(get_current_user)):
+async def sessionList(
+    db: db_dependency,
+    current_user: User = Depends(get_current_user),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    limit: int = Query(LIST_PAGE_SIZE, ge=1, le=LIST_MAX_PAGE_SIZE),
+    stream: bool = Query(False, description="Stream every remaining session as one JSON array"),
+):
     try:
-        sessions = db.query(SessionModel).filter(SessionModel.user_id == current_user.id).all()
-        print(sessions)
-        return sessions
-    except Exception as e:
-        print(e)
-        return []
+        statement = user_sessions(current_user.id, after=cursor, limit=None if stream else limit + 1)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if stream:
+        return json_stream_response(stream_scalars(statement, session_item))
+    sessions = (await db.scalars(statement)).all()
+    return page_response([session_item(session) for session in sessions], sessions, limit, "started_at")
 
 
 @app.get("/message/list/{session_id}", response_model=List)
-async def sessionList(db: db_dependency, _: None = Depends(get_current_user), session_id: UUID = Path(..., description="Session ID to filter messages by")):
+async def sessionList(
+    db: db_dependency,
+    current_user: User = Depends(get_current_user),
+    session_id: UUID = Path(..., description="Session ID to filter messages by"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    limit: int = Query(LIST_PAGE_SIZE, ge=1, le=LIST_MAX_PAGE_SIZE),
+    stream: bool = Query(False, description="Stream every remaining message as one JSON array"),
+):
+    owner = await db.scalar(select(SessionModel.user_id).where(SessionModel.id == session_id))
+    # Staff read complaint threads from the inbox, everyone else only their own sessions
+    if owner is None or (owner != current_user.id and not (current_user.is_admin or current_user.is_staff)):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
     try:
-        response = []
-        messages = db.query(MessageModel).filter(MessageModel.session_id == session_id).all()
-
-        for message in messages:
-            if message.is_from_user:
-                response.append({"user": message.text})
-            else:
-                response.append({"system": message.text})
-        print(response)
-        return response
-    
-    except Exception as e:
-        print(e)
-        return []
-    
+        statement = session_messages(session_id, after=cursor, limit=None if stream else limit + 1)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if stream:
+        return json_stream_response(stream_scalars(statement, message_item))
+    messages = (await db.scalars(statement)).all()
+    return page_response([message_item(message) for message in messages], messages, limit, "timestamp")
+
+
+@app.get("/message/search")
+async def messageSearch(
+    db: db_dependency,
+    current_user: User = Depends(get_current_user),
+    q: str = Query(..., min_length=2, max_length=200, description="Words to look for, matched as prefixes and fuzzily"),
+    session_type: Optional[SessionType] = Query(None),
+    user_id: Optional[UUID] = Query(None, description="Staff only, whose sessions to search"),
+    session_id: Optional[UUID] = Query(None),
+    since: Optional[datetime] = Query(None, description="Messages sent at or after, defaults to SEARCH_DEFAULT_DAYS ago"),
+    until: Optional[datetime] = Query(None, description="Messages sent before"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    limit: int = Query(LIST_PAGE_SIZE, ge=1, le=LIST_MAX_PAGE_SIZE),
+    fuzzy: bool = Query(True, description="Also match misspelled words (trigram similarity)"),
+):
+    # Staff search every transcript, everyone else only their own
+    if not (current_user.is_admin or current_user.is_staff):
+        user_id = current_user.id
+    try:
+        statement = search_messages(
+            q, user_id=user_id, session_type=session_type, session_id=session_id,
+            since=since, until=until, after=cursor, limit=limit + 1, fuzzy=fuzzy,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    rows = (await db.execute(statement)).all()
+    return page_response([dict(row._mapping) for row in rows], rows, limit, "timestamp")
 
 
 @app.post("/session/create", response_model=str)
 async def sessionCreateRequest(message: sessionCreate, db: db_dependency, current_user: User = Depends(get_current_user)):
     try:
-        new_session = SessionModel(user_id=current_user.id, title=message.message)
+        new_session = SessionModel(user_id=current_user.id, title=message.message, type=message.type)
         db.add(new_session)
-        db.commit()
-        db.refresh(new_session)
+        if message.type == SessionType.COMPLAIN:
+            # The inbox row commits with the session, so staff never see one without the other
+            await db.flush()
+            open_complaint(db, new_session, current_user)
+        await db.commit()
     except Exception as e:
         print(e)
 
     return str(new_session.id)
 
 
-@app.post("/message/send")
-async def messageCreate(messageData: MessageCreate, db: db_dependency, current_user: User = Depends(get_current_user)):
+@app.post("/message/send", dependencies=[Depends(rag_ready)])
+async def messageCreate(messageData: MessageCreate, request: Request, db: db_dependency, current_user: User = Depends(get_current_user)):
+    # Conversation memory is per session, only its owner may use it
+    owned = await db.scalar(select(SessionModel.id).where(
+        SessionModel.id == messageData.session_id, SessionModel.user_id == current_user.id
+    ))
+    if owned is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
+    RAG.governor.check_admission(current_user.id)
+    # Write-behind: the consumer persists both messages from the stream
+    question = message_event(messageData.session_id, messageData.text, is_from_user=True)
+    await publish_messages(question)
     try:
-        
-        answer = RAG.retriever(query=messageData.text)
+        answer = RAG.retriever(
+            query=messageData.text,
+            organization_id=current_user.organization_id,
+            department_id=current_user.department_id,
+            session_id=messageData.session_id,
+            user_id=current_user.id,
+            message_id=question["id"],
+        )
 
-        return {"status": "success", "message": answer}
+        return sse_response(persist_answer(answer, messageData.session_id), request)
     except Exception as e:
         print(f"error from send{e}")
         raise HTTPException(
@@ -355,12 +483,18 @@ async def messageCreate(messageData: MessageCreate, db: db_dependency, current_u
         )
 
 
-@app.post("/voice/send")
-async def voicemessage(request: sessionCreate, current_user: User = Depends(get_current_user)):
+@app.post("/voice/send", dependencies=[Depends(rag_ready)])
+async def voicemessage(request: sessionCreate, http_request: Request, current_user: User = Depends(get_current_user)):
+    RAG.governor.check_admission(current_user.id)
     try:
-        return StreamingResponse(
-            RAG.retriever(query=request.message),
-            media_type="text/event-stream",
+        return sse_response(
+            RAG.retriever(
+                query=request.message,
+                organization_id=current_user.organization_id,
+                department_id=current_user.department_id,
+                user_id=current_user.id,
+            ),
+            http_request,
         )
     except Exception as e:
         print(f"error from send{e}")
@@ -370,10 +504,10 @@ async def voicemessage(request: sessionCreate, current_user: User = Depends(get_
         )
 
 
-def get_or_create_user(user_data: dict, db: Session):
+async def get_or_create_user(user_data: dict, db: AsyncSession):
     print("function is called!")
     """Get or create a user in the database"""
-    user = db.query(User).filter(User.email == user_data['email']).first()
+    user = await get_user(db, user_data['email'])
     
     if not user:
         user = User(
@@ -383,7 +517,6 @@ def get_or_create_user(user_data: dict, db: Session):
         )
         print(user)
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
     
     return user
@@ -0,0 +1,123 @@
+"""
+Write-behind persistence of chat messages through a Redis Stream.
+
+Request handlers XADD each user and assistant message and move on; the
+consumer in consumer/consumer_script.py reads them in batches and
+bulk-inserts them into `messages`. Every event carries its own message
+UUID, so an event delivered twice (consumer crashed between commit and
+XACK) is inserted once.
+"""
+import os
+import uuid
+import asyncio
+from datetime import datetime
+from typing import Dict, List
+
+from metrics import Counter
+
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+MESSAGE_STREAM = os.getenv("MESSAGE_STREAM", "messages")
+# Approximate cap on stream length, the oldest entries beyond it are trimmed
+# whether or not they were consumed, so keep it far above any expected backlog
+MESSAGE_STREAM_MAXLEN = int(os.getenv("MESSAGE_STREAM_MAXLEN", "100000"))
+
+MESSAGES_PUBLISHED = Counter(
+    "message_events_published_total", "Chat messages handed to persistence, by path (stream, direct)",
+    labelnames=("path",),
+)
+
+_redis = None
+
+
+def message_event(session_id, text: str, is_from_user: bool, assigned_to=None) -> Dict[str, str]:
+    event = {
+        "id": str(uuid.uuid4()),
+        "session_id": str(session_id),
+        "text": text,
+        "is_from_user": "1" if is_from_user else "0",
+        "timestamp": datetime.now().isoformat(),
+    }
+    if assigned_to is not None:
+        event["assigned_to"] = str(assigned_to)
+    return event
+
+
+def event_row(event: Dict[str, str]) -> dict:
+    """Column values for one stream event, raises on malformed events"""
+    return {
+        "id": uuid.UUID(event["id"]),
+        "session_id": uuid.UUID(event["session_id"]),
+        "text": event["text"],
+        "is_from_user": event["is_from_user"] == "1",
+        "assigned_to": uuid.UUID(event["assigned_to"]) if event.get("assigned_to") else None,
+        "timestamp": datetime.fromisoformat(event["timestamp"]),
+    }
+
+
+def insert_messages(db, rows: List[dict]):
+    """
+    Bulk insert in the caller's transaction, rows that already exist are
+    skipped. The complaint inbox is updated from the rows actually inserted.
+    """
+    from models import Message
+    from inbox import apply_messages
+
+    if not rows:
+        return
+    if db.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    inserted = db.execute(
+        insert(Message).values(rows).on_conflict_do_nothing(index_elements=["id"]).returning(
+            Message.id, Message.session_id, Message.text, Message.is_from_user, Message.assigned_to, Message.timestamp,
+        )
+    ).all()
+    apply_messages(db, inserted)
+
+
+def _insert_now(events: List[Dict[str, str]]):
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        insert_messages(db, [event_row(event) for event in events])
+        db.commit()
+    finally:
+        db.close()
+
+
+def redis_client():
+    global _redis
+    if _redis is None:
+        import redis.asyncio as redis
+        _redis = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+    return _redis
+
+
+async def publish_messages(*events: Dict[str, str]):
+    """
+    XADD the events in one round trip. If Redis is unavailable the messages
+    are written straight to the database instead, so they are never dropped.
+    """
+    try:
+        async with redis_client().pipeline(transaction=False) as pipe:
+            for event in events:
+                pipe.xadd(MESSAGE_STREAM, event, maxlen=MESSAGE_STREAM_MAXLEN, approximate=True)
+            await pipe.execute()
+        MESSAGES_PUBLISHED.labels("stream").inc(len(events))
+    except Exception as e:
+        print(f"Message stream unavailable, writing {len(events)} messages directly: {e}")
+        await asyncio.to_thread(_insert_now, list(events))
+        MESSAGES_PUBLISHED.labels("direct").inc(len(events))
+
+
+async def persist_answer(tokens, session_id):
+    """Pass a token stream through and publish the answer once it completed"""
+    parts = []
+    async for token in tokens:
+        parts.append(token)
+        yield token
+    if parts:
+        await publish_messages(message_event(session_id, "".join(parts), is_from_user=False))
@@ -1,5 +1,6 @@
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String, Text
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Boolean, Column, Computed, DateTime, ForeignKey, Index, Integer, String, Text
+from sqlalchemy.dialects.postgresql import TSVECTOR, UUID
+from sqlalchemy.orm import deferred
 from datetime import datetime
 import uuid
 from database import Base
@@ -11,6 +12,10 @@ class SessionType(PyEnum):
     CHAT = 'chat'
     COMPLAIN = 'complain'
 
+class ComplaintStatus(PyEnum):
+    OPEN = 'open'
+    ANSWERED = 'answered'
+
 class User(Base):
     __tablename__ = "users"
 
@@ -23,14 +28,14 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     organization_id = Column(UUID(as_uuid=True), ForeignKey('organization.id'), nullable=True)
     department_id = Column(UUID(as_uuid=True), ForeignKey('department.id'), nullable=True)
-    started_at = Column(DateTime, default=datetime.now())
+    started_at = Column(DateTime, default=datetime.now)
 
 class Organization(Base):
     __tablename__ = "organization"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name = Column(Text)
-    started_at = Column(DateTime, default=datetime.now())
+    started_at = Column(DateTime, default=datetime.now)
 
 class Department(Base):
     __tablename__ = "department"
@@ -38,7 +43,7 @@ class Department(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name = Column(Text)
     organization_id = Column(UUID(as_uuid=True), ForeignKey('organization.id'))
-    started_at = Column(DateTime, default=datetime.now())
+    started_at = Column(DateTime, default=datetime.now)
 
 class Context(Base):
     __tablename__ = "context"
@@ -49,8 +54,8 @@ class Context(Base):
     user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'))
     organization_id = Column(UUID(as_uuid=True), ForeignKey('organization.id'))
     department_id = Column(UUID(as_uuid=True), ForeignKey('department.id'))
-    started_at = Column(DateTime, default=datetime.now())
-    updated_at = Column(DateTime, default=datetime.now())
+    started_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now)
 
 
 class Categories(Base):
@@ -59,7 +64,7 @@ class Categories(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     description = Column(Text)
     name = Column(Text)
-    started_at = Column(DateTime, default=datetime.now())
+    started_at = Column(DateTime, default=datetime.now)
 
 class Businesses(Base):
     __tablename__ = "businesses"
@@ -69,7 +74,7 @@ class Businesses(Base):
     description = Column(Text)
     content = Column(Text)
     location = Column(Text)
-    started_at = Column(DateTime, default=datetime.now())
+    started_at = Column(DateTime, default=datetime.now)
 
 class Session(Base):
     __tablename__ = "sessions"
@@ -78,7 +83,12 @@ class Session(Base):
     user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'))
     type = Column(Enum(SessionType, name="sessiontype"), nullable=False, default=SessionType.CHAT)
     title = Column(Text, nullable=False)
-    started_at = Column(DateTime, default=datetime.now())
+    started_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        Index("ix_sessions_type_started_at", "type", "started_at"),
+        Index("ix_sessions_user_id_started_at_id", "user_id", "started_at", "id"),
+    )
 
 class Message(Base):
     __tablename__ = "messages"
@@ -87,5 +97,33 @@ class Message(Base):
     text = Column(Text, nullable=False)
     is_from_user = Column(Boolean, nullable=False)  # True=user, False=bot
     assigned_to = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=True)
-    timestamp = Column(DateTime, default=datetime.now())
-
+    timestamp = Column(DateTime, default=datetime.now)
+    # Maintained by Postgres for search, deferred so listings don't load it
+    search_vector = deferred(Column(TSVECTOR, Computed("to_tsvector('simple'::regconfig, coalesce(text, ''))", persisted=True)))
+
+    # The trigram index on text needs pg_trgm, it only exists through migration e4a8b6d1f953
+    __table_args__ = (
+        Index("ix_messages_session_id_timestamp_id", "session_id", "timestamp", "id"),
+        Index("ix_messages_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_messages_timestamp", "timestamp"),
+    )
+
+# One row per complaint session, kept up to date by inbox.py on the write path
+class ComplaintInbox(Base):
+    __tablename__ = "complaint_inbox"
+
+    session_id = Column(UUID(as_uuid=True), ForeignKey('sessions.id'), primary_key=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'))
+    email = Column(String)
+    name = Column(Text)
+    first_message_id = Column(UUID(as_uuid=True), nullable=True)
+    first_message = Column(Text, nullable=True)
+    first_message_at = Column(DateTime, nullable=True)
+    message_count = Column(Integer, nullable=False, default=0)
+    status = Column(Enum(ComplaintStatus, name="complaintstatus"), nullable=False, default=ComplaintStatus.OPEN)
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+    last_activity_at = Column(DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (
+        Index("ix_complaint_inbox_created_at", "created_at", "session_id"),
+    )
@@ -3,6 +3,7 @@ import re
 from openai import OpenAI
 import unicodedata
 from dotenv import load_dotenv
+from llm_governor import GOVERNOR, LLM_BASE_URL, LLM_MODEL, llm_api_key
 
 
 load_dotenv()
@@ -84,16 +85,19 @@ def _mongolian_llm_correction(text: str) -> str:
     Оролт: {text}
     Гаралт:
     """
-    api_key = os.getenv("DEEPSEEK_API_KEY")
-    client = OpenAI(api_key=api_key, base_url="https://api.deepseek.com")
-    response = client.chat.completions.create(
-        model="deepseek-chat",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant"},
-            {"role": "user", "content": prompt},
-        ],
-        stream=False
-    )
+    client = OpenAI(api_key=llm_api_key(), base_url=LLM_BASE_URL, max_retries=0)
+    # Shares the in-flight limits with the chat endpoints, retries throttling with backoff
+    with GOVERNOR.slot_sync("normalizer"):
+        response = GOVERNOR.create(
+            client,
+            label="normalizer",
+            model=LLM_MODEL,
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant"},
+                {"role": "user", "content": prompt},
+            ],
+            stream=False
+        )
 
     print(response.choices[0].message.content)
     # Call your Mongolian-capable LLM here
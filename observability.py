@@ -0,0 +1,59 @@
+import time
+from contextvars import ContextVar
+
+from metrics import Gauge, Histogram
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Request latency until the last body byte is sent, per route template",
+    labelnames=("method", "route", "status"),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being handled")
+
+# The ASGI scope of the request being handled; routing fills in scope["route"]
+# later, so readers look the route up lazily
+_request_scope: ContextVar = ContextVar("request_scope", default=None)
+
+
+def current_route() -> str:
+    """Route template of the current request, "background" outside of one"""
+    scope = _request_scope.get()
+    if scope is None:
+        return "background"
+    route = scope.get("route")
+    # Unmatched paths share one label so scanners can't blow up cardinality
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware timing every HTTP request. Unlike a BaseHTTPMiddleware
+    it sees the end of streamed (SSE) bodies and doesn't buffer them.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = _request_scope.set(scope)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            HTTP_REQUEST_SECONDS.labels(scope["method"], current_route(), status).observe(time.perf_counter() - started)
+            _request_scope.reset(token)
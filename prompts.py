@@ -0,0 +1,52 @@
+"""
+Prompt layout for DeepSeek's context (prefix) cache.
+
+The provider caches prompts by their leading tokens, so everything that is
+the same for every request lives in the system message and comes first.
+Per-request content (the complaint, retrieved context, the question) always
+goes in the last message, and session history sits between the two where it
+only ever grows at the end.
+"""
+from typing import Dict, List
+
+from langchain_core.documents import Document
+
+
+ASSISTANT_SYSTEM_PROMPT = "Чи бол ухаалаг туслах."
+
+COMPLAINT_SYSTEM_PROMPT = (
+    "Та Монгол Улсын төрийн байгууллагын өмнөговь аймаг дахь салбарын гомдол, санал хүсэлтийн хэлтэст ажилладаг албан ёсны мэргэжилтэн.\n"
+    "Таны үүрэг бол иргэдээс ирүүлсэн гомдол, санал, мэдээлэл хүссэн асуултад **албан ёсны, эелдэг, хүндэтгэлтэй, ойлгомжтой, товч тодорхой** хариу өгөх юм.\n\n"
+
+    "Та дараах зааврын дагуу шууд иргэнд илгээхэд бэлэн, бүрэн боловсруулсан хариулт боловсруулна:\n"
+    "- Монгол хэл дээр\n"
+    "- Албан ёсны, бичгийн хэллэгтэй\n"
+    "- Эелдэг, хүндэтгэлтэй\n"
+    "- Товч бөгөөд тодорхой, ойлгомжтой\n"
+    "- Зөв бичгийн дүрмийн дагуу\n"
+    "- Хариулт нь өмнөговь аймгийн салбарын байр суурийг илэрхийлсэн байх\n"
+    "- Иргэнд илгээхэд шууд бэлэн байхаар бичих (дахин засварлах шаардлагагүй)"
+)
+
+RAG_SYSTEM_PROMPT = (
+    f"{ASSISTANT_SYSTEM_PROMPT}\n\n"
+    "Хэрэглэгчийн мессеж бүрт өгөгдсөн контекст мэдээллээр асуултанд хариулна уу:"
+    "\n1. Хэрэв мэдээлэл хангалттай бол монгол хэлээр товч, ойлгомжтой хариул."
+    "\n2. Хэрэв мэдээлэл байхгүй бол 'Мэдэхгүй байна' гэж хариул."
+)
+
+
+def complaint_messages(query: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": COMPLAINT_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Дараах иргэнээс ирсэн гомдол/асуултад хариулна уу:\n{query}\n\nХариулт:\n"},
+    ]
+
+
+def rag_messages(docs: List[Document], history: List[Dict[str, str]], query: str) -> List[Dict[str, str]]:
+    context = "\n\n".join(doc.page_content for doc in docs)
+    return [
+        {"role": "system", "content": RAG_SYSTEM_PROMPT},
+        *history,
+        {"role": "user", "content": f"Контекст:\n{context}\n\nАсуулт: {query}"},
+    ]
@@ -0,0 +1,172 @@
+"""
+Statements behind the list endpoints, kept out of main.py so
+check_query_plans.py can EXPLAIN exactly what the routes run.
+"""
+import os
+import re
+import base64
+from uuid import UUID
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from sqlalchemy import func, literal, literal_column, or_, select, tuple_
+
+from models import ComplaintInbox, ComplaintStatus, Message, Session, SessionType
+
+
+# Default look-back of the complaint inbox when the caller gives no `since`
+COMPLAIN_LIST_DAYS = int(os.getenv("COMPLAIN_LIST_DAYS", "30"))
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "50"))
+LIST_MAX_PAGE_SIZE = int(os.getenv("LIST_MAX_PAGE_SIZE", "500"))
+
+
+def encode_cursor(position: datetime, row_id, rank: Optional[float] = None) -> str:
+    """Opaque keyset cursor for the row a page ended on, ranked listings include the rank"""
+    parts = [position.isoformat(), str(row_id)]
+    if rank is not None:
+        parts.append(repr(float(rank)))
+    return base64.urlsafe_b64encode("|".join(parts).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode(cursor: str, size: int) -> list:
+    try:
+        parts = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8").split("|")
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    if len(parts) != size:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return parts
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """Raises ValueError for cursors this module didn't produce"""
+    position, row_id = _decode(cursor, 2)
+    try:
+        return datetime.fromisoformat(position), UUID(row_id)
+    except ValueError as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def decode_ranked_cursor(cursor: str) -> Tuple[float, datetime, UUID]:
+    position, row_id, rank = _decode(cursor, 3)
+    try:
+        return float(rank), datetime.fromisoformat(position), UUID(row_id)
+    except ValueError as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def user_sessions(user_id, after: Optional[str] = None, limit: Optional[int] = None):
+    """A user's sessions newest first, continuing after `after` (a cursor)"""
+    query = select(Session).where(Session.user_id == user_id)
+    if after is not None:
+        query = query.where(tuple_(Session.started_at, Session.id) < decode_cursor(after))
+    query = query.order_by(Session.started_at.desc(), Session.id.desc())
+    return query.limit(limit) if limit is not None else query
+
+
+def session_messages(session_id, after: Optional[str] = None, limit: Optional[int] = None):
+    """A session's messages in conversation order, continuing after `after` (a cursor)"""
+    query = select(Message).where(Message.session_id == session_id)
+    if after is not None:
+        query = query.where(tuple_(Message.timestamp, Message.id) > decode_cursor(after))
+    query = query.order_by(Message.timestamp, Message.id)
+    return query.limit(limit) if limit is not None else query
+
+
+def complaint_inbox(since: Optional[datetime] = None, until: Optional[datetime] = None, limit: int = 50,
+                    status: Optional[ComplaintStatus] = None):
+    """
+    Newest complaint sessions with their first message, newest first.
+
+    Reads only the complaint_inbox projection (see inbox.py), one range scan
+    of its created_at index however large `messages` grows.
+    """
+    if since is None:
+        since = datetime.now() - timedelta(days=COMPLAIN_LIST_DAYS)
+    query = (
+        select(
+            ComplaintInbox.first_message_id.label("id"),
+            ComplaintInbox.session_id,
+            ComplaintInbox.email,
+            ComplaintInbox.name,
+            ComplaintInbox.first_message.label("text"),
+            ComplaintInbox.status,
+            ComplaintInbox.last_activity_at,
+        )
+        # Sessions nobody wrote in yet have nothing to show
+        .where(ComplaintInbox.created_at >= since, ComplaintInbox.first_message_id.is_not(None))
+    )
+    if until is not None:
+        query = query.where(ComplaintInbox.created_at < until)
+    if status is not None:
+        query = query.where(ComplaintInbox.status == status)
+    return query.order_by(ComplaintInbox.created_at.desc(), ComplaintInbox.session_id.desc()).limit(limit)
+
+
+# Mongolian has no Postgres stemmer, so words are indexed unstemmed ('simple')
+# and matched as prefixes, which covers suffixed forms (захиалга -> захиалгын);
+# the trigram index catches misspellings
+SEARCH_DEFAULT_DAYS = int(os.getenv("SEARCH_DEFAULT_DAYS", "90"))
+SEARCH_MIN_SIMILARITY_TERM = 3
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def search_terms(q: str) -> list:
+    return [word.lower() for word in _WORD.findall(q)]
+
+
+def search_messages(q: str, user_id=None, session_type: Optional[SessionType] = None, session_id=None,
+                    since: Optional[datetime] = None, until: Optional[datetime] = None,
+                    after: Optional[str] = None, limit: int = LIST_PAGE_SIZE, fuzzy: bool = True):
+    """
+    Messages matching `q`, best match first: every word as a prefix in the
+    full-text index, or with `fuzzy` also the phrase as a trigram word match
+    (misspellings). Ranked by ts_rank_cd plus trigram word similarity, ties
+    broken newest first.
+
+    Every match in the date range gets ranked, so the range bounds the work:
+    without `since` only the last SEARCH_DEFAULT_DAYS days are searched.
+    Raises ValueError for a query without words or a bad cursor.
+    """
+    terms = search_terms(q)
+    if not terms:
+        raise ValueError("The search query has no words")
+    if since is None:
+        since = datetime.now() - timedelta(days=SEARCH_DEFAULT_DAYS)
+    phrase = " ".join(terms)
+    # Only word characters reach to_tsquery, so user input can't inject tsquery syntax
+    ts_query = func.to_tsquery(literal_column("'simple'::regconfig"), " & ".join(f"{term}:*" for term in terms))
+    conditions = [Message.search_vector.op("@@", is_comparison=True)(ts_query)]
+    rank = func.ts_rank_cd(Message.search_vector, ts_query)
+    if fuzzy and len(phrase) >= SEARCH_MIN_SIMILARITY_TERM:
+        conditions.append(literal(phrase).op("<%", is_comparison=True)(Message.text))
+        rank = rank + func.word_similarity(literal(phrase), Message.text)
+    rank = rank.label("rank")
+
+    query = select(
+        Message.id, Message.session_id, Message.text, Message.is_from_user, Message.timestamp, rank,
+    ).where(or_(*conditions), Message.timestamp >= since)
+    if until is not None:
+        query = query.where(Message.timestamp < until)
+    if session_id is not None:
+        query = query.where(Message.session_id == session_id)
+    if user_id is not None or session_type is not None:
+        sessions = select(Session.id)
+        if user_id is not None:
+            sessions = sessions.where(Session.user_id == user_id)
+        if session_type is not None:
+            sessions = sessions.where(Session.type == session_type)
+        query = query.where(Message.session_id.in_(sessions))
+    if after is not None:
+        query = query.where(tuple_(rank, Message.timestamp, Message.id) < decode_ranked_cursor(after))
+    page = query.order_by(rank.desc(), Message.timestamp.desc(), Message.id.desc()).limit(limit).subquery("page")
+
+    # Session details only for the page, not for every match being ranked
+    return (
+        select(
+            page.c.id, page.c.session_id, Session.type.label("session_type"), Session.user_id,
+            page.c.text, page.c.is_from_user, page.c.timestamp, page.c.rank,
+        )
+        .join(Session, Session.id == page.c.session_id)
+        .order_by(page.c.rank.desc(), page.c.timestamp.desc(), page.c.id.desc())
+    )
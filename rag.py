@@ -1,190 +1,275 @@
 import os
 import json
+import time
+import asyncio
 
 from openai import AsyncOpenAI, OpenAI
 from langchain.text_splitter import CharacterTextSplitter
-from langchain_community.document_loaders import TextLoader
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain.retrievers import EnsembleRetriever
-from langchain_community.retrievers import BM25Retriever
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from sentence_transformers import SentenceTransformer
-from langchain_chroma import Chroma
-import chromadb
 from dotenv import load_dotenv
 from typing import AsyncGenerator
+from concurrent.futures import ThreadPoolExecutor
+from conversation import ConversationMemory
+from llm_backends import BackendPool
+from llm_governor import GOVERNOR
+from prompts import complaint_messages, rag_messages
+from embeddings import CachedQueryEmbeddings, EmbeddingBatcher, load_embedding_model, embedding_signature
+from ingest import BASE_DIR, FILES_DIR, DB_DIR, CHROMA_DIR, ingest, open_vector_store, scan_sources, store_signature
+from knowledge_base import KnowledgeBase, TenantKnowledgeBases
+from rerank import Reranker
+from semantic_cache import SemanticAnswerCache
+from retrieval import RAG_STAGE_SECONDS, chunk_id
 
 
 class Rag:
     def __init__(self):
         
         load_dotenv()
-        api_key = os.getenv("DEEPSEEK_API_KEY")
-        self.client = AsyncOpenAI(api_key=api_key, base_url="https://api.deepseek.com")
+        # Every completion goes through the shared governor (in-flight limits, retries)
+        self.governor = GOVERNOR
+        # Configured OpenAI-compatible backends, slow first tokens get hedged to the next one
+        self.llm = BackendPool.from_env(self.governor)
         self.settings = {
-            "model": "deepseek-chat",
             "temperature": 0.3,
             "max_tokens": 1000,
             "top_p": 0.95,
-            "stream": True
+            "stream": True,
+            # Final chunk carries usage, including DeepSeek's prefix-cache hit/miss tokens
+            "stream_options": {"include_usage": True},
         }
-        self.docs = None
-        self.embedding = None
-        self.db = None
+        self.embeddings = None
+        # Global corpus from data/files, plus per organization/department corpora from Context rows
+        self.kb = None
+        self.tenants = None
+        self.kb_version = None
+        self.executor = None
+        self._warmup_task = None
+        self._warmup_failed_at = None
+        # A failed warmup is started again on the next start_warmup call after this many seconds
+        self.warmup_retry_seconds = float(os.getenv("RAG_WARMUP_RETRY", "30"))
+        # Finished answers keyed by query embedding, replayed for near-duplicate questions
+        self.answer_cache = SemanticAnswerCache(
+            threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+            maxsize=int(os.getenv("SEMANTIC_CACHE_SIZE", "512")),
+            ttl=float(os.getenv("SEMANTIC_CACHE_TTL", "86400")),
+        )
         # Document types supported
         self.DOCUMENT_TYPES = {
             "иргэний үнэмлэхний лавалгаа": "civil_certificate",
             "оршин суугаа газрын тодорхойлолт": "residence_certificate", 
             "төрсний гэрчилгээ": "birth_certificate"
         }
-        self.message_history = [{"role": "system", "content": "Чи бол ухаалаг туслах."}]
+        # Chat history per session, trimmed to a token budget before every completion
+        self.memory = ConversationMemory(
+            budget_tokens=int(os.getenv("CONVERSATION_TOKEN_BUDGET", "1500")),
+            maxsize=int(os.getenv("CONVERSATION_CACHE_SIZE", "1024")),
+            ttl=float(os.getenv("CONVERSATION_CACHE_TTL", "3600")),
+        )
     
     def setup(self):
-        
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        file_path = os.path.join(current_dir, "data/files", "main.txt")
-        persistent_db = os.path.join(current_dir, "data/db", "chroma_db")
 
-        # Ensure the text file exists
-        if not os.path.exists(file_path):
+        bm25_dir = os.path.join(DB_DIR, "bm25_index")
+        backend = os.getenv("EMBEDDING_BACKEND", "torch")
+        onnx_dir = os.getenv("ONNX_MODEL_DIR", os.path.join(BASE_DIR, "data/models", "multilingual-e5-large-onnx"))
+
+        # Ensure there is something to index
+        if not scan_sources(FILES_DIR):
             raise FileNotFoundError(
-                f"The file {file_path} does not exist. Please chech the path"
+                f"No source files found in {FILES_DIR}. Please chech the path"
             )
-        
-            # Read the text content from the file
-        loader = TextLoader(file_path)
-        documents = loader.load()
-
-        # Split the document into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=300,       # Smaller chunks for agglutinative languages
-            chunk_overlap=50,     # Overlap to preserve context
-            separators=["\n\n", "\n", "。", " ", ""]  # Mongolian-specific separators
+
+        model = load_embedding_model(backend, onnx_dir)
+        # Query vectors are cached so repeated questions skip the model forward pass,
+        # cache misses from concurrent requests are encoded together in one batch
+        self.embeddings = CachedQueryEmbeddings(
+            model,
+            maxsize=int(os.getenv("EMBED_CACHE_SIZE", "1024")),
+            ttl=float(os.getenv("EMBED_CACHE_TTL", "3600")),
+            batcher=EmbeddingBatcher(
+                model,
+                max_batch_size=int(os.getenv("EMBED_BATCH_SIZE", "16")),
+                max_wait_ms=float(os.getenv("EMBED_BATCH_WAIT_MS", "5")),
+            ),
+        )
+        print("\n--- Finished creating Embedding ---")
+
+        # One bounded pool shared by every knowledge base's retrieval stages
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("RETRIEVAL_WORKERS", "4")), thread_name_prefix="retrieval"
+            )
+        # Wide first-stage recall, then a latency-budgeted rerank picks the prompt context
+        reranker = Reranker(
+            kind=os.getenv("RERANKER", "embedding"),
+            budget_ms=float(os.getenv("RERANK_BUDGET_MS", "150")),
+            executor=self.executor,
+            model_name=os.getenv("RERANK_MODEL"),
         )
-        self.docs = text_splitter.split_documents(documents)
+        kb_kwargs = {
+            "k": int(os.getenv("RAG_CONTEXT_K", "6")),
+            "first_stage_k": int(os.getenv("RAG_FIRST_STAGE_K", "20")),
+            "weights": [0.6, 0.4],  # Tune based on your tests
+            "stage_timeout": float(os.getenv("RETRIEVAL_STAGE_TIMEOUT", "3")),
+            "reranker": reranker,
+        }
 
-        #Display information about the split document
-        print("\n--- Document chunk Information ---")
-        print(f"Number of document chunks {len(self.docs)}")
-        print(f"Sample chunk:\n{self.docs[0].page_content}\n")
+        # Only chunks that are new since the last run get embedded, removed ones are deleted
+        signature = store_signature(embedding_signature(backend))
+        store = open_vector_store(self.embeddings, CHROMA_DIR)
+        result = ingest(store, signature)
+        print(f"\n--- Ingestion: {result.summary()} ---")
 
+        self.kb = KnowledgeBase("global", result.chunks, store, bm25_dir, self.embeddings, self.executor, **kb_kwargs)
+        if self.kb_version != self.kb.version:
+            # Cached answers were grounded in the old chunks
+            self.answer_cache.invalidate()
+            self.kb_version = self.kb.version
 
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="intfloat/multilingual-e5-large",
-            model_kwargs={"device": "cpu"},
-            encode_kwargs={"normalize_embeddings": True}  # Crucial for accuracy
+        self.tenants = TenantKnowledgeBases(
+            self.embeddings, signature, self.executor,
+            max_bytes=int(float(os.getenv("TENANT_KB_MEMORY_MB", "256")) * 1024 * 1024),
+            refresh_seconds=float(os.getenv("TENANT_KB_REFRESH", "60")),
+            **kb_kwargs,
         )
-        print("\n--- Finished creating Embedding ---")
 
-        if not os.path.exists(persistent_db):
-            print("Persistant directory does not exist. Initializing vector store...")
-
-            
-            
-            # Create the vector store and persist it automatically
-
-            print("\n --- Creating vector store ---") 
-            self.db = Chroma.from_documents(
-                documents=self.docs,
-                embedding=self.embeddings,
-                persist_directory=persistent_db,
-                client_settings=chromadb.config.Settings(
-                    anonymized_telemetry=False,
-                    is_persistent=True
-                )
-            )
+    async def knowledge_base(self, organization_id=None, department_id=None) -> KnowledgeBase:
+        """Corpus for the caller's organization/department, the global one if they have none"""
+        if organization_id is None:
+            return self.kb
+        try:
+            kb = await self.tenants.get(organization_id, department_id)
+        except Exception as e:
+            print(f"Tenant knowledge base unavailable, using global corpus: {e}")
+            return self.kb
+        return kb if len(kb) else self.kb
 
-            print("\n--- Finished creating vector store ---")
-        else:
-            # Create the vector store and persist it automatically
-            
-            print("Persistant directory exist...")
-            self.db = Chroma(
-                persist_directory=persistent_db,
-                embedding_function=self.embeddings,
-                client_settings=chromadb.config.Settings(
-                    anonymized_telemetry=False,
-                    is_persistent=True
-                )
-            )
-    
-    async def generate(self, query: str)-> AsyncGenerator[str, None]:
-        combined_input = (
-            "Та Монгол Улсын төрийн байгууллагын өмнөговь аймаг дахь салбарын гомдол, санал хүсэлтийн хэлтэст ажилладаг албан ёсны мэргэжилтэн.\n"
-            "Таны үүрэг бол иргэдээс ирүүлсэн гомдол, санал, мэдээлэл хүссэн асуултад **албан ёсны, эелдэг, хүндэтгэлтэй, ойлгомжтой, товч тодорхой** хариу өгөх юм.\n\n"
-
-            "Дараах иргэнээс ирсэн гомдол/асуултад хариулна уу:\n"
-            f"{query}\n\n"
-
-            "Та дараах зааврын дагуу шууд иргэнд илгээхэд бэлэн, бүрэн боловсруулсан хариулт боловсруулна:\n"
-            "- Монгол хэл дээр\n"
-            "- Албан ёсны, бичгийн хэллэгтэй\n"
-            "- Эелдэг, хүндэтгэлтэй\n"
-            "- Товч бөгөөд тодорхой, ойлгомжтой\n"
-            "- Зөв бичгийн дүрмийн дагуу\n"
-            "- Хариулт нь өмнөговь аймгийн салбарын байр суурийг илэрхийлсэн байх\n"
-            "- Иргэнд илгээхэд шууд бэлэн байхаар бичих (дахин засварлах шаардлагагүй)\n\n"
-
-            "Хариулт:\n"
+    def start_warmup(self):
+        """
+        Run setup in a background thread so the app can serve requests meanwhile.
+        A failed warmup is retried, at most once every `warmup_retry_seconds`.
+        """
+        retry = (
+            self.status == "failed"
+            and time.monotonic() - self._warmup_failed_at >= self.warmup_retry_seconds
         )
+        if self._warmup_task is None or retry:
+            if retry:
+                print(f"Retrying RAG warmup after: {self.warmup_error}")
+            self._warmup_task = asyncio.get_running_loop().create_task(asyncio.to_thread(self.setup))
+            self._warmup_task.add_done_callback(self._warmup_done)
+        return self._warmup_task
 
-        
-        accumulated = ""
+    def _warmup_done(self, task):
+        if task.cancelled() or task.exception() is not None:
+            self._warmup_failed_at = time.monotonic()
+            print(f"RAG warmup failed: {self.warmup_error}")
+        else:
+            print("RAG warmup finished")
+
+    @property
+    def status(self) -> str:
+        if self._warmup_task is None:
+            return "idle"
+        if not self._warmup_task.done():
+            return "warming"
+        if self._warmup_task.cancelled() or self._warmup_task.exception() is not None:
+            return "failed"
+        return "ready"
+
+    @property
+    def warmup_error(self):
+        """Why the last warmup failed, None unless the status is failed"""
+        if self.status != "failed":
+            return None
+        if self._warmup_task.cancelled():
+            return "warmup was cancelled"
+        return repr(self._warmup_task.exception())
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    async def wait_ready(self, timeout: float) -> bool:
+        """Wait up to `timeout` seconds for warmup, True once the pipeline is usable"""
+        if self._warmup_task is None:
+            return False
+        try:
+            await asyncio.wait_for(asyncio.shield(self._warmup_task), timeout)
+        except asyncio.TimeoutError:
+            return False
+        except Exception:
+            pass
+        return self.ready
 
+    async def generate(self, query: str, user_id=None)-> AsyncGenerator[str, None]:
         try:
             # Get the completion response
-            response = await self.client.chat.completions.create(
-                messages=[*self.message_history, {"role": "user", "content": combined_input}],
+            async for chunk in self.llm.astream(
+                user_id,
+                label="complaint_answer",
+                messages=complaint_messages(query),
                 **self.settings
-            )
-            async for chunk in response:
-                if token := chunk.choices[0].delta.content or "":
-                    if not accumulated.endswith(token):
-                        accumulated += token
-                        # 4) yield just the new bit, so your SSE client/appends get only
-                        #    what was added this round
-                        yield token
+            ):
+                if chunk.choices and (token := chunk.choices[0].delta.content or ""):
+                    yield token
 
         except Exception as e:
             print(f"Error getting response: {str(e)}")
+            raise
 
-    async def retriever(self, query: str, voice=False)-> AsyncGenerator[str, None]:
-        vector_retriever = self.db.as_retriever(search_kwargs={"k": 3})
-        # Lexical retriever (BM25)
-        bm25_retriever = BM25Retriever.from_documents(self.docs)
-        bm25_retriever.k = 3
+    async def retriever(self, query: str, voice=False, organization_id=None, department_id=None, session_id=None, user_id=None,
+                        message_id=None)-> AsyncGenerator[str, None]:
+        """`message_id` is the id the question was published under, kept out of its own history"""
+        kb = await self.knowledge_base(organization_id, department_id)
+        query_embedding, history = await asyncio.gather(kb.aembed_query(query), self.memory.history(session_id, message_id))
+        # A follow-up ("what about the second one?") depends on the conversation, not just
+        # the query, so only the first question of a conversation uses the answer cache
+        cacheable = query_embedding is not None and not history
+        if cacheable:
+            started = time.perf_counter()
+            cached = self.answer_cache.lookup(query_embedding, kb.name, kb.version)
+            RAG_STAGE_SECONDS.labels("answer_cache").observe(time.perf_counter() - started)
+            if cached is not None:
+                for token in cached.tokens:
+                    yield token
+                self.memory.append(
+                    session_id,
+                    {"role": "user", "content": query},
+                    {"role": "assistant", "content": cached.text},
+                )
+                return
 
-        # Ensemble both
-        ensemble_retriever = EnsembleRetriever(
-            retrievers=[vector_retriever, bm25_retriever],
-            weights=[0.6, 0.4]  # Tune based on your tests
-        )
-        relevant_docs = ensemble_retriever.invoke(query)
-        
-        combined_input = (
-            "Дараах мэдээллээр асуултанд хариулна уу:"
-            + "\n1. Хэрэв мэдээлэл хангалттай бол монгол хэлээр товч, ойлгомжтой хариул."
-            + "\n2. Хэрэв мэдээлэл байхгүй бол 'Мэдэхгүй байна' гэж хариул."
-            + "\n\n Контекст: ".join([doc.page_content for doc in relevant_docs])
-            + f"\n\n Асуулт: {query}"
-        )
-        accumulated = ""
+        relevant_docs = await kb.asearch(query, query_embedding)
+
+        started = time.perf_counter()
+        messages = rag_messages(relevant_docs, history, query)
+        RAG_STAGE_SECONDS.labels("prompt_build").observe(time.perf_counter() - started)
+        tokens = []
         try:
             # Get the completion response
-            response = await self.client.chat.completions.create(
-                messages=[*self.message_history, {"role": "user", "content": combined_input}],
+            async for chunk in self.llm.astream(
+                user_id,
+                label="rag",
+                messages=messages,
                 **self.settings
-            )
-            async for chunk in response:
-                if token := chunk.choices[0].delta.content or "":
-                    if not accumulated.endswith(token):
-                        accumulated += token
-                        # 4) yield just the new bit, so your SSE client/appends get only
-                        #    what was added this round
-                        yield token
+            ):
+                if chunk.choices and (token := chunk.choices[0].delta.content or ""):
+                    tokens.append(token)
+                    yield token
 
         except Exception as e:
             print(f"Error getting response: {str(e)}")
-            text_content = f"Error getting response: {str(e)}"
+            raise
 
-        self.message_history.append({"role": "assistant", "content": accumulated})    
\ No newline at end of file
+        if tokens:
+            if cacheable:
+                self.answer_cache.store(
+                    query, query_embedding, tokens,
+                    [chunk_id(doc) for doc in relevant_docs], kb.name, kb.version
+                )
+            # History keeps the bare question, the retrieved context is rebuilt every turn
+            self.memory.append(
+                session_id,
+                {"role": "user", "content": query},
+                {"role": "assistant", "content": "".join(tokens)},
+            )
@@ -0,0 +1,98 @@
+import asyncio
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from cache import TTLCache, normalize_query
+from metrics import Counter
+from retrieval import chunk_id
+
+
+RERANKERS = ("embedding", "cross-encoder", "none")
+
+RERANK_OUTCOMES = Counter(
+    "rag_rerank_total", "Rerank attempts by outcome (reranked, cached, budget_exceeded, failed, skipped)",
+    labelnames=("outcome",),
+)
+
+
+def stored_embeddings(store, ids: List[str]) -> dict:
+    """Chunk vectors already in the vector store, so reranking needs no extra forward pass"""
+    found = store.get(ids=ids, include=["embeddings"])
+    return dict(zip(found["ids"], found["embeddings"]))
+
+
+class Reranker:
+    """
+    Second stage over the fused first-stage candidates.
+
+    `embedding` scores each chunk by cosine similarity between the query
+    vector and the chunk vector already stored in the index. `cross-encoder`
+    runs a small cross-encoder over (query, chunk) pairs. Scoring runs on
+    the retrieval pool under a hard per-request budget; if the budget runs
+    out the fused order is used. Scores are cached per (query, chunk) so
+    repeated questions skip the work, late results still fill the cache.
+    """
+
+    def __init__(self, kind: str = "embedding", budget_ms: float = 150, executor=None,
+                 model_name: Optional[str] = None, cache_size: int = 4096, cache_ttl: float = 3600):
+        if kind not in RERANKERS:
+            raise ValueError(f"Unknown reranker '{kind}', expected one of {RERANKERS}")
+        self.kind = kind
+        self.budget = budget_ms / 1000
+        self.executor = executor
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl, name="rerank_scores")
+        self.model = None
+        if kind == "cross-encoder":
+            from sentence_transformers import CrossEncoder
+            self.model = CrossEncoder(model_name or "BAAI/bge-reranker-base", device="cpu")
+
+    def _score(self, query: str, query_embedding, docs: List[Document], store, key: str) -> List[float]:
+        ids = [chunk_id(doc) for doc in docs]
+        if self.kind == "embedding":
+            vectors = stored_embeddings(store, ids)
+            query_vector = np.asarray(query_embedding, dtype=np.float32)
+            scores = [float(np.dot(np.asarray(vectors[i], dtype=np.float32), query_vector)) if i in vectors else float("-inf") for i in ids]
+        else:
+            scores = [float(s) for s in self.model.predict([(query, doc.page_content) for doc in docs])]
+        for i, score in zip(ids, scores):
+            self.cache.set((key, i), score)
+        return scores
+
+    async def rerank(self, query: str, query_embedding, docs: List[Document], store, k: int) -> List[Document]:
+        fallback = docs[:k]
+        if self.kind == "none" or len(docs) <= 1 or (self.kind == "embedding" and query_embedding is None):
+            RERANK_OUTCOMES.labels("skipped").inc()
+            return fallback
+
+        key = normalize_query(query)
+        scores = {}
+        missing = []
+        for doc in docs:
+            score = self.cache.get((key, chunk_id(doc)))
+            if score is None:
+                missing.append(doc)
+            else:
+                scores[chunk_id(doc)] = score
+
+        if missing:
+            loop = asyncio.get_running_loop()
+            work = loop.run_in_executor(self.executor, self._score, query, query_embedding, missing, store, key)
+            try:
+                fresh = await asyncio.wait_for(asyncio.shield(work), timeout=self.budget)
+            except asyncio.TimeoutError:
+                RERANK_OUTCOMES.labels("budget_exceeded").inc()
+                return fallback
+            except Exception as e:
+                print(f"Rerank failed, using fused order: {e}")
+                RERANK_OUTCOMES.labels("failed").inc()
+                return fallback
+            scores.update(zip((chunk_id(doc) for doc in missing), fresh))
+            RERANK_OUTCOMES.labels("reranked").inc()
+        else:
+            RERANK_OUTCOMES.labels("cached").inc()
+
+        # Stable sort keeps the fused order between equal scores
+        ranked = sorted(docs, key=lambda doc: scores[chunk_id(doc)], reverse=True)
+        return ranked[:k]
@@ -0,0 +1,111 @@
+import time
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, List, Optional, Sequence
+
+from langchain_core.documents import Document
+
+from metrics import Counter, Histogram
+
+
+RAG_STAGE_SECONDS = Histogram(
+    "rag_stage_seconds", "Time spent in each RAG pipeline stage (embed, vector, bm25, fusion, rerank, prompt_build, ...)",
+    labelnames=("stage",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+RAG_STAGE_FAILURES = Counter("rag_stage_failures_total", "Retrieval stages that timed out or failed", labelnames=("stage", "reason"))
+
+
+def chunk_id(doc: Document) -> str:
+    """Stable identifier of a retrieved chunk"""
+    if doc.metadata.get("chunk_id"):
+        return doc.metadata["chunk_id"]
+    return hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()[:16]
+
+
+def reciprocal_rank_fusion(result_lists: Sequence[List[Document]], weights: Sequence[float], c: int = 60) -> List[Document]:
+    """Weighted RRF, the same fusion EnsembleRetriever applies"""
+    scores = {}
+    docs = {}
+    for results, weight in zip(result_lists, weights):
+        for rank, doc in enumerate(results, start=1):
+            key = chunk_id(doc)
+            scores[key] = scores.get(key, 0.0) + weight / (rank + c)
+            docs.setdefault(key, doc)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+class HybridRetriever:
+    """
+    Async hybrid search: the vector and lexical stages run concurrently on a
+    bounded thread pool so neither the model forward pass, the vector search
+    nor BM25 scoring blocks the event loop.
+
+    Every stage has its own timeout. A stage that times out or fails
+    contributes no results instead of holding up the stream.
+    """
+
+    def __init__(
+        self,
+        embed_query: Callable[[str], Awaitable[List[float]]],
+        vector_search: Callable[[List[float]], List[Document]],
+        lexical_search: Callable[[str], List[Document]],
+        weights: Sequence[float] = (0.6, 0.4),
+        max_workers: int = 4,
+        stage_timeout: float = 3.0,
+        executor: Optional[ThreadPoolExecutor] = None,
+    ):
+        self.embed_query = embed_query
+        self.vector_search = vector_search
+        self.lexical_search = lexical_search
+        self.weights = list(weights)
+        self.stage_timeout = stage_timeout
+        # Knowledge bases can share one pool so the bound holds across all of them
+        self._owns_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="retrieval")
+
+    async def _run_stage(self, name: str, fn, *args):
+        started = time.perf_counter()
+        if asyncio.iscoroutinefunction(fn):
+            work = fn(*args)
+        else:
+            work = asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        try:
+            return await asyncio.wait_for(work, timeout=self.stage_timeout)
+        except asyncio.TimeoutError:
+            print(f"Retrieval stage '{name}' timed out after {self.stage_timeout}s")
+            RAG_STAGE_FAILURES.labels(name, "timeout").inc()
+        except Exception as e:
+            print(f"Retrieval stage '{name}' failed: {e}")
+            RAG_STAGE_FAILURES.labels(name, "error").inc()
+        finally:
+            RAG_STAGE_SECONDS.labels(name).observe(time.perf_counter() - started)
+        return None
+
+    async def aembed_query(self, query: str) -> Optional[List[float]]:
+        return await self._run_stage("embed", self.embed_query, query)
+
+    async def asearch(self, query: str, query_embedding: Optional[List[float]] = None) -> List[Document]:
+        """
+        Fused vector and BM25 results. `query_embedding` comes from aembed_query;
+        None (the embed stage failed or timed out) means BM25 only, embedding
+        again would double the latency the stage timeout bounds.
+        """
+        stages = [self._run_stage("bm25", self.lexical_search, query)]
+        if query_embedding is not None:
+            stages.append(self._run_stage("vector", self.vector_search, query_embedding))
+        lexical_docs, *rest = await asyncio.gather(*stages)
+        vector_docs = rest[0] if rest else None
+
+        started = time.perf_counter()
+        fused = reciprocal_rank_fusion(
+            [vector_docs or [], lexical_docs or []],
+            self.weights,
+        )
+        RAG_STAGE_SECONDS.labels("fusion").observe(time.perf_counter() - started)
+        return fused
+
+    def shutdown(self):
+        if self._owns_executor:
+            self.executor.shutdown(wait=False)
@@ -2,6 +2,8 @@
 from pydantic import BaseModel
 from datetime import datetime
 from uuid import UUID
+from typing import Optional
+from models import SessionType, ComplaintStatus
 
 class QueryRequest(BaseModel):
     query: str
@@ -13,8 +15,10 @@ class complainAnswer(BaseModel):
 class Complain(BaseModel):
     id: UUID
     session_id: UUID
-    email: UUID 
-    name: UUID 
+    email: Optional[str] = None
+    name: Optional[str] = None
+    status: Optional[ComplaintStatus] = None
+    last_activity_at: Optional[datetime] = None
     text: str
 
 class LoginRequest(BaseModel):
@@ -23,6 +27,7 @@ class LoginRequest(BaseModel):
 
 class sessionCreate(BaseModel):
     message: str
+    type: SessionType = SessionType.CHAT
 
 class RefreshTokenRequest(BaseModel):
     refresh_token: str
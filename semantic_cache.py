@@ -0,0 +1,105 @@
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import numpy as np
+
+from cache import export_cache_metrics
+
+
+@dataclass
+class CachedAnswer:
+    query: str
+    embedding: np.ndarray
+    tokens: List[str]
+    chunk_ids: List[str]
+    scope: str
+    kb_version: str
+    created_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def text(self) -> str:
+        return "".join(self.tokens)
+
+
+class SemanticAnswerCache:
+    """
+    Caches streamed RAG answers by query embedding.
+
+    A new query reuses a stored answer when its cosine similarity to the
+    stored query clears `threshold` and the answer was produced against the
+    same knowledge base (`scope`, e.g. the tenant) at the same version. Only
+    answers that depend on nothing but the query and that knowledge base may
+    be stored, i.e. not answers to follow-ups in a conversation. Embeddings are expected to be normalized,
+    so similarity is a single matrix-vector dot product.
+    """
+
+    def __init__(self, threshold: float = 0.95, maxsize: int = 512, ttl: float = 86400):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._matrix = None
+        self._keys = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        export_cache_metrics("answers", self)
+
+    def _rebuild_matrix(self):
+        self._keys = list(self._entries.keys())
+        if self._keys:
+            self._matrix = np.stack([self._entries[k].embedding for k in self._keys])
+        else:
+            self._matrix = None
+
+    def lookup(self, embedding, scope: str, kb_version: str) -> Optional[CachedAnswer]:
+        query = np.asarray(embedding, dtype=np.float32)
+        now = time.monotonic()
+        with self._lock:
+            if self._matrix is None:
+                self.misses += 1
+                return None
+            scores = self._matrix @ query
+            for i in np.argsort(-scores):
+                if scores[i] < self.threshold:
+                    break
+                key = self._keys[i]
+                entry = self._entries[key]
+                if entry.scope != scope or entry.kb_version != kb_version or now - entry.created_at > self.ttl:
+                    continue
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def store(self, query: str, embedding, tokens: List[str], chunk_ids: List[str], scope: str, kb_version: str):
+        entry = CachedAnswer(
+            query=query,
+            embedding=np.asarray(embedding, dtype=np.float32),
+            tokens=list(tokens),
+            chunk_ids=list(chunk_ids),
+            scope=scope,
+            kb_version=kb_version,
+        )
+        with self._lock:
+            self._entries[self._next_key] = entry
+            self._next_key += 1
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._rebuild_matrix()
+
+    def invalidate(self):
+        """Drop every entry, called whenever the index is rebuilt"""
+        with self._lock:
+            self._entries.clear()
+            self._rebuild_matrix()
+
+    def __len__(self):
+        return len(self._entries)
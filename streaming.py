@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import asyncio
+from typing import AsyncIterator, Optional
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+
+# Tokens arriving within this window go out as one frame
+SSE_FLUSH_MS = float(os.getenv("SSE_FLUSH_MS", "50"))
+# Comment frame sent when nothing else went out for this long, keeps proxies from timing out
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+
+_DONE = object()
+
+
+def sse_event(data: str, event: Optional[str] = None) -> str:
+    """One well-formed SSE event, multi-line data becomes several data: fields"""
+    lines = [f"event: {event}"] if event else []
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+async def sse_stream(tokens: AsyncIterator[str], request: Optional[Request] = None,
+                     flush_ms: float = SSE_FLUSH_MS, keepalive: float = SSE_KEEPALIVE_SECONDS):
+    """
+    Turn a token generator into SSE frames.
+
+    Tokens are read by a separate task and coalesced into one `data` frame
+    every `flush_ms`. A `done` event ends a complete answer, an `error`
+    event a failed one. If the client goes away (the response is cancelled,
+    or `request` reports a disconnect) the producer is cancelled and the
+    token generator closed, which closes the upstream completion stream.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    flush_interval = flush_ms / 1000
+
+    async def produce():
+        try:
+            async for token in tokens:
+                queue.put_nowait(token)
+            queue.put_nowait(_DONE)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            queue.put_nowait(e)
+
+    producer = asyncio.create_task(produce())
+    buffer = []
+    sent_data = False
+    last_sent = time.monotonic()
+    try:
+        while True:
+            now = time.monotonic()
+            if buffer:
+                timeout = max(flush_interval - (now - last_sent), 0)
+            else:
+                timeout = max(keepalive - (now - last_sent), 0)
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                if request is not None and await request.is_disconnected():
+                    break
+                if buffer:
+                    yield sse_event("".join(buffer))
+                    buffer.clear()
+                    sent_data = True
+                else:
+                    yield ": keepalive\n\n"
+                last_sent = time.monotonic()
+                continue
+
+            if item is _DONE or isinstance(item, Exception):
+                if buffer:
+                    yield sse_event("".join(buffer))
+                    buffer.clear()
+                if item is _DONE:
+                    yield sse_event("{}", event="done")
+                else:
+                    print(f"Stream failed: {item}")
+                    error = {"detail": "Failed to generate a response"}
+                    if getattr(item, "status_code", None) == 429:
+                        error = {"detail": str(item), "status": 429}
+                    yield sse_event(json.dumps(error), event="error")
+                break
+
+            buffer.append(item)
+            # The first token goes out right away, coalescing only starts after it
+            if not sent_data or time.monotonic() - last_sent >= flush_interval:
+                yield sse_event("".join(buffer))
+                buffer.clear()
+                sent_data = True
+                last_sent = time.monotonic()
+    finally:
+        # Client gone or stream finished: stop pulling tokens from upstream
+        producer.cancel()
+        try:
+            await producer
+        except (asyncio.CancelledError, Exception):
+            pass
+        aclose = getattr(tokens, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+def sse_response(tokens: AsyncIterator[str], request: Optional[Request] = None) -> StreamingResponse:
+    return StreamingResponse(
+        sse_stream(tokens, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def json_array_stream(items: AsyncIterator, batch: int = 100):
+    """Serialize items into one JSON array incrementally, `batch` items per chunk, encoded like FastAPI responses"""
+    chunk = ["["]
+    first = True
+    async for item in items:
+        chunk.append(("" if first else ",") + json.dumps(jsonable_encoder(item)))
+        first = False
+        if len(chunk) >= batch:
+            yield "".join(chunk)
+            chunk.clear()
+    chunk.append("]")
+    yield "".join(chunk)
+
+
+def json_stream_response(items: AsyncIterator) -> StreamingResponse:
+    return StreamingResponse(json_array_stream(items), media_type="application/json")
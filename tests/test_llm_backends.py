@@ -0,0 +1,72 @@
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+from llm_backends import Backend, BackendPool
+
+
+def chunk(content):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))], usage=None)
+
+
+class FakeStream:
+    def __init__(self, ttft):
+        self.ttft = ttft
+        self.closed = False
+
+    async def _chunks(self):
+        await asyncio.sleep(self.ttft)
+        yield chunk("answer")
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeClient:
+    def __init__(self, ttft):
+        self.ttft = ttft
+
+    async def open(self):
+        return FakeStream(self.ttft)
+
+
+class FakeGovernor:
+    async def acreate(self, client, **kwargs):
+        return await client.open()
+
+    @asynccontextmanager
+    async def slot(self, user=None):
+        yield
+
+
+def backend(name, ttft):
+    b = Backend(name, "http://localhost:1", "model")
+    b.client = FakeClient(ttft)
+    return b
+
+
+async def answer(pool):
+    return [c.choices[0].delta.content async for c in pool.astream(label="test")]
+
+
+def test_slow_hedge_that_loses_stays_behind_the_winner():
+    primary = backend("primary", 0.2)
+    slow = backend("slow", 0.5)
+    pool = BackendPool([primary, slow], FakeGovernor(), hedge_after=0.15)
+
+    assert asyncio.run(answer(pool)) == ["answer"]
+
+    # The hedge was cancelled 0.05s in, which says nothing good about its TTFT
+    assert slow.ttft >= primary.ttft
+    assert pool.ordered()[0] is primary
+
+
+def test_cancelled_attempt_only_raises_the_estimate():
+    b = backend("b", 1.0)
+    b.observe_cancelled(0.1)
+    assert b.ttft == 1.0
+    b.observe_cancelled(3.0)
+    assert b.ttft > 1.0
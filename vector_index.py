@@ -0,0 +1,204 @@
+import os
+import json
+import threading
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+
+DTYPES = ("float16", "int8")
+# Bumped when the on-disk layout changes, older indexes are rebuilt
+FORMAT = 2
+
+
+class NumpyVectorStore:
+    """
+    Flat vector index for small corpora: normalized embeddings in one
+    memory-mapped float16 (or per-row int8-quantized) matrix plus a parallel
+    chunk-ID list. Top-k is a single matrix-vector product, no HNSW graph,
+    SQLite or background threads.
+
+    Only vectors and chunk IDs are stored; texts come from the chunk store
+    (`chunks`, set by KnowledgeBase) when results are returned. New vectors
+    are appended to the files, only deletes rewrite them.
+
+    Implements the subset of the Chroma interface the ingestion and
+    retrieval code use, so it can be swapped in with VECTOR_STORE=numpy.
+    """
+
+    def __init__(self, directory: str, embedding_function, dtype: str = "float16", chunks=None):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown vector dtype '{dtype}', expected one of {DTYPES}")
+        self.directory = directory
+        self.embedding_function = embedding_function
+        self.dtype = dtype
+        self.chunks = chunks
+        # Serializes writers; readers take one snapshot of (vectors, scales, ids, positions)
+        self._lock = threading.Lock()
+        self._load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _map(self, name: str, dtype, shape):
+        return np.memmap(self._path(name), dtype=dtype, mode="r", shape=shape) if shape[0] else None
+
+    def _load(self):
+        try:
+            with open(self._path("meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("format") != FORMAT:
+                raise ValueError("index was written in an older format")
+            if meta["dtype"] != self.dtype:
+                raise ValueError(f"index was written as {meta['dtype']}")
+            count, dim, ids_bytes = meta["count"], meta["dim"], meta["ids_bytes"]
+            with open(self._path("ids.txt"), "rb") as f:
+                ids = f.read(ids_bytes).decode("utf-8").split("\n")[:count] if count else []
+            if len(ids) != count:
+                raise ValueError("chunk ID file is shorter than the index")
+            vectors = self._map("vectors.bin", self.dtype, (count, dim))
+            scales = self._map("scales.bin", np.float32, (count,)) if self.dtype == "int8" else None
+        except (FileNotFoundError, ValueError, KeyError):
+            vectors, scales, ids, dim, ids_bytes = None, None, [], 0, 0
+        self._dim = dim
+        self._ids_bytes = ids_bytes
+        self._state = (vectors, scales, ids, {chunk: i for i, chunk in enumerate(ids)})
+
+    @property
+    def ids(self) -> List[str]:
+        return self._state[2]
+
+    def __len__(self):
+        return len(self._state[2])
+
+    def _quantize(self, vectors: np.ndarray):
+        if self.dtype == "float16":
+            return vectors.astype(np.float16), None
+        scales = np.abs(vectors).max(axis=1, initial=0.0) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+
+    def _write_meta(self, count: int):
+        meta = {"format": FORMAT, "dtype": self.dtype, "dim": self._dim, "count": count, "ids_bytes": self._ids_bytes}
+        with open(self._path("meta.tmp.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(self._path("meta.tmp.json"), self._path("meta.json"))
+
+    def _append_file(self, name: str, offset: int, data: bytes):
+        # Bytes past `offset` are left over from an interrupted append, nobody maps them
+        with open(self._path(name), "r+b" if os.path.exists(self._path(name)) else "wb") as f:
+            f.seek(offset)
+            f.write(data)
+            f.truncate()
+
+    def _append(self, embedded: np.ndarray, new_ids: List[str]):
+        vectors, scales, ids, positions = self._state
+        if not self._dim:
+            self._dim = embedded.shape[1]
+        elif embedded.shape[1] != self._dim:
+            raise ValueError(f"Vectors have {embedded.shape[1]} dimensions, the index has {self._dim}")
+        os.makedirs(self.directory, exist_ok=True)
+        quantized, new_scales = self._quantize(embedded)
+        count = len(ids)
+        self._append_file("vectors.bin", count * self._dim * quantized.itemsize, quantized.tobytes())
+        if new_scales is not None:
+            self._append_file("scales.bin", count * 4, new_scales.tobytes())
+        encoded = "".join(f"{chunk}\n" for chunk in new_ids).encode("utf-8")
+        self._append_file("ids.txt", self._ids_bytes, encoded)
+        self._ids_bytes += len(encoded)
+        # Meta goes last, until then readers and restarts see the old row count
+        self._write_meta(count + len(new_ids))
+
+        ids = ids + list(new_ids)
+        positions = dict(positions)
+        positions.update((chunk, count + i) for i, chunk in enumerate(new_ids))
+        total = len(ids)
+        self._state = (
+            self._map("vectors.bin", self.dtype, (total, self._dim)),
+            self._map("scales.bin", np.float32, (total,)) if self.dtype == "int8" else None,
+            ids,
+            positions,
+        )
+
+    def _rewrite(self, keep: List[int]):
+        """Keep only the rows at `keep`, written to new files so current readers keep the old ones"""
+        vectors, scales, ids, _ = self._state
+        os.makedirs(self.directory, exist_ok=True)
+
+        def replace(name, data: bytes):
+            with open(self._path(f"{name}.tmp"), "wb") as f:
+                f.write(data)
+            os.replace(self._path(f"{name}.tmp"), self._path(name))
+
+        kept_ids = [ids[i] for i in keep]
+        encoded = "".join(f"{chunk}\n" for chunk in kept_ids).encode("utf-8")
+        replace("vectors.bin", np.ascontiguousarray(vectors[keep]).tobytes() if keep else b"")
+        if self.dtype == "int8":
+            replace("scales.bin", np.ascontiguousarray(scales[keep]).tobytes() if keep else b"")
+        replace("ids.txt", encoded)
+        if not keep:
+            self._dim = 0
+        self._ids_bytes = len(encoded)
+        self._write_meta(len(kept_ids))
+        self._load()
+
+    def reset_collection(self):
+        with self._lock:
+            self._rewrite([])
+
+    def delete(self, ids: Optional[List[str]] = None):
+        drop = set(ids or [])
+        with self._lock:
+            current = self._state[2]
+            if any(chunk in drop for chunk in current):
+                self._rewrite([i for i, chunk in enumerate(current) if chunk not in drop])
+
+    def add_documents(self, documents: List[Document], ids: List[str]) -> List[str]:
+        embedded = np.asarray(self.embedding_function.embed_documents([doc.page_content for doc in documents]), dtype=np.float32)
+        with self._lock:
+            # Upsert: replaced IDs drop their old row, new ones are just appended
+            positions = self._state[3]
+            replaced = {chunk for chunk in ids if chunk in positions}
+            if replaced:
+                self._rewrite([i for i, chunk in enumerate(self._state[2]) if chunk not in replaced])
+            if ids:
+                self._append(embedded, list(ids))
+        return list(ids)
+
+    def get(self, ids: List[str], include=("embeddings",)) -> dict:
+        """Chroma-style lookup of stored vectors by chunk ID"""
+        vectors, scales, _, positions = self._state
+        found = [chunk for chunk in ids if chunk in positions]
+        rows = [positions[chunk] for chunk in found]
+        embeddings = np.asarray(vectors[rows], dtype=np.float32) if rows else np.zeros((0, 0), dtype=np.float32)
+        if scales is not None and rows:
+            embeddings *= np.asarray(scales[rows])[:, None]
+        return {"ids": found, "embeddings": embeddings}
+
+    @staticmethod
+    def _top_k(state, embedding, k: int):
+        vectors, scales, _, _ = state
+        if vectors is None or len(vectors) == 0:
+            return []
+        scores = vectors @ np.asarray(embedding, dtype=np.float32)
+        if scales is not None:
+            scores *= scales
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def search_ids_by_vector(self, embedding, k: int):
+        """Top-k (chunk ID, score) pairs from one dot product over the whole matrix"""
+        state = self._state
+        return [(state[2][i], score) for i, score in self._top_k(state, embedding, k)]
+
+    def document(self, chunk: str) -> Document:
+        doc = self.chunks.document_by_id(chunk) if self.chunks is not None else None
+        # Without the chunk store (or for a chunk it no longer has) only the ID is known
+        return doc or Document(page_content="", metadata={"chunk_id": chunk})
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, **kwargs) -> List[Document]:
+        return [self.document(chunk) for chunk, _ in self.search_ids_by_vector(embedding, k)]